@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Пакетная обработка записей OEEG без Streamlit.
+
+Для каждого файла выполняется то же, что на страницах приложения: разбор
+записи → MEAN/SEM по блокам → перенос маркеров → таблицы Excel и графики
+каналов. Файлы обрабатываются параллельно в отдельных процессах,
+результаты складываются в ``<папка вывода>/<имя файла>/``.
+
+Пример::
+
+    python batch.py D:\\records --window 10 --out D:\\results
+    python batch.py "records/2024-*.txt" --format SVG --jobs 4
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from channel_plot import (DEFAULT_MARKER_SPACING, EXPORT_DPI, EXPORT_FORMATS, build_channel_figure,
+                          build_mean_sem_figure, save_figure)
+from mean_sem import block_mean_sem, carry_markers_forward, mean_only
+from recording import BANDS, GROUPS, load_recording
+from table_export import TABLE_FORMATS, write_excel, write_table
+
+
+def find_inputs(patterns):
+    """Список файлов записей: папки раскрываются в *.txt, остальное трактуется как шаблон glob"""
+    files = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            files += sorted(path.glob("*.txt"))
+        else:
+            files += sorted(Path(p) for p in glob.glob(pattern, recursive=True))
+    # Убираем повторы, сохраняя порядок
+    return list(dict.fromkeys(p.resolve() for p in files if p.is_file()))
+
+
+def process_file(path, out_root, window_size, fmt=None, dpi=EXPORT_DPI, marker_spacing=DEFAULT_MARKER_SPACING,
+                 table_format="Excel"):
+    """
+    Обрабатывает одну запись; ``fmt=None`` — без графиков.
+    Таблицы пишутся в Excel (MEAN+SEM и только MEAN) или одной таблицей в Parquet/CSV.
+    Возвращает (число строк, число записанных файлов).
+    """
+    recording = load_recording(path)
+    df = recording.frame
+    _, df_mean_sem, block_times = block_mean_sem(df, GROUPS, BANDS, window_size)
+    df_clean = carry_markers_forward(df_mean_sem)
+
+    base_name = Path(path).stem
+    dest_dir = Path(out_root) / base_name
+    dest_dir.mkdir(parents=True, exist_ok=True)
+
+    if table_format == "Excel":
+        write_excel(dest_dir / f"{base_name}_MEAN_SEM_{window_size}.xlsx", {'MEAN_SEM': df_clean})
+        write_excel(dest_dir / f"{base_name}_MEAN_ONLY_{window_size}.xlsx", {'MEAN_ONLY': mean_only(df_clean)})
+        written = 2
+    else:
+        ext = TABLE_FORMATS[table_format]
+        write_table(df_clean, dest_dir / f"{base_name}_MEAN_SEM_{window_size}.{ext}", ext)
+        written = 1
+
+    if fmt is not None:
+        ext = fmt.lower()
+        for selected in [g for g in GROUPS if (g, BANDS[0]) in df.columns]:
+            save_figure(build_channel_figure(recording, selected, marker_spacing),
+                        dest_dir / f"{selected}.{ext}", fmt, dpi)
+            for show_sem in (True, False):
+                suffix = f"{selected}_mean_sem_{window_size}" if show_sem else f"{selected}_mean_{window_size}"
+                save_figure(build_mean_sem_figure(df_clean, block_times, selected, BANDS, show_sem),
+                            dest_dir / f"{suffix}.{ext}", fmt, dpi)
+                written += 1
+            written += 1
+    return len(recording), written
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная обработка записей OEEG: MEAN/SEM, Excel и графики")
+    parser.add_argument("inputs", nargs="+", help="папки с .txt-файлами или шаблоны вида records/*.txt")
+    parser.add_argument("-o", "--out", default=".", help="папка для результатов (по умолчанию текущая)")
+    parser.add_argument("-w", "--window", type=int, default=10,
+                        help="число значений в блоке для MEAN и SEM (по умолчанию 10)")
+    parser.add_argument("-f", "--format", choices=EXPORT_FORMATS, default="PNG", help="формат графиков")
+    parser.add_argument("--dpi", type=int, default=EXPORT_DPI, help="разрешение графиков")
+    parser.add_argument("-t", "--tables", choices=["Excel", *TABLE_FORMATS], default="Excel",
+                        help="формат таблиц MEAN/SEM (по умолчанию Excel)")
+    parser.add_argument("--no-plots", action="store_true", help="только таблицы, без графиков")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="число параллельных процессов (по умолчанию — число ядер)")
+    args = parser.parse_args(argv)
+    if args.window < 1:
+        parser.error("размер окна должен быть больше нуля")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    files = find_inputs(args.inputs)
+    if not files:
+        print("Не найдено ни одного файла записи")
+        return 1
+
+    fmt = None if args.no_plots else args.format
+    jobs = max(1, min(args.jobs, len(files)))
+    print(f"Файлов: {len(files)}, процессов: {jobs}, окно: {args.window}, результаты: {Path(args.out).resolve()}")
+
+    started = time.perf_counter()
+    total_rows = failed = 0
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {
+            pool.submit(process_file, path, args.out, args.window, fmt, args.dpi,
+                        table_format=args.tables): path
+            for path in files
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                rows, written = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {path.name}: {str(e).splitlines()[0] if str(e) else type(e).__name__}")
+                continue
+            total_rows += rows
+            print(f"✅ {path.name}: {rows} строк, файлов сохранено: {written}")
+
+    elapsed = time.perf_counter() - started
+    done = len(files) - failed
+    print("-" * 40)
+    rows_per_second = f"{total_rows / elapsed:,.0f}".replace(",", " ")
+    print(f"Обработано {done} из {len(files)} файлов за {elapsed:.1f} с: "
+          f"{done / elapsed:.2f} файлов/с, {rows_per_second} строк/с")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
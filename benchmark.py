@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Замеры скорости всех этапов обработки на синтетических записях.
+
+Генератор пишет записи в том же текстовом формате, что и прибор: время
+``HH:MM:SS``, столбец маркера (``.`` или буква с точкой — ``В.``, ``О.``,
+``Э.`` ...) и 54 значения (9 групп × 6 диапазонов). Для каждого размера
+записи замеряются разбор, MEAN/SEM, перенос маркеров, группировка маркеров,
+графики matplotlib и Plotly и выгрузка в Excel; результаты пишутся в JSON,
+чтобы сравнивать версии между собой.
+
+Пример::
+
+    python benchmark.py --sizes 3600 36000 --repeat 3 --output bench_results.json
+
+Набор ``--preset large`` — запись из 500 000 строк с ~10 000 маркеров
+(1,2 маркера в минуту): на таком размере сравниваются режимы SVG и WebGL
+страницы «Анализ графика»::
+
+    python benchmark.py --preset large --repeat 1 --output bench_large.json
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from recording import BANDS, GROUPS
+
+# Буквы маркеров, которые ставит прибор
+MARKER_LETTERS = "ВОЭДКИЗ"
+
+# Наборы размеров: по умолчанию 1, 10 и 50 часов; large — 500 000 строк и ~10 000 маркеров
+PRESETS = {
+    "default": {"sizes": [3600, 36000, 180000], "markers_per_minute": 1.0},
+    "large": {"sizes": [500000], "markers_per_minute": 1.2},
+}
+
+
+def generate_recording(n_rows, markers_per_minute=1.0, seed=0, start="10:00:00", trailing_rate=0.0):
+    """
+    Текст синтетической записи из ``n_rows`` строк с шагом в секунду.
+
+    Маркеры ставятся случайно, в среднем ``markers_per_minute`` в минуту;
+    ``trailing_rate`` — доля строк с хвостовой пометкой прибора после значений.
+    """
+    rng = np.random.default_rng(seed)
+    start_second = sum(int(part) * k for part, k in zip(start.split(":"), (3600, 60, 1)))
+    second_of_day = (start_second + np.arange(n_rows)) % 86400
+    clock = [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in second_of_day]
+
+    markers = np.full(n_rows, ".", dtype=object)
+    has_marker = rng.random(n_rows) < markers_per_minute / 60
+    letters = rng.choice(list(MARKER_LETTERS), size=int(has_marker.sum()))
+    markers[has_marker] = [f"{letter}." for letter in letters]
+
+    # Медленная составляющая (УПП) крупнее остальных диапазонов, как в настоящих записях
+    values = rng.gamma(2.0, 5.0, size=(n_rows, len(GROUPS) * len(BANDS)))
+    values[:, ::len(BANDS)] = rng.normal(0.0, 60.0, size=(n_rows, len(GROUPS)))
+
+    table = pd.DataFrame(values)
+    table.insert(0, "marker", markers)
+    table.insert(0, "time", clock)
+    if trailing_rate:
+        table["tail"] = np.where(rng.random(n_rows) < trailing_rate, "X", "")
+
+    buffer = []
+    buffer.append("# Синтетическая запись OEEG\n")
+    buffer.append(table.to_csv(sep=" ", header=False, index=False, float_format="%.2f"))
+    return "".join(buffer)
+
+
+def measure(function, repeat):
+    """Время выполнения ``function`` в секундах для каждого из ``repeat`` запусков и последний результат"""
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return timings, result
+
+
+def benchmark_size(n_rows, repeat, window_size, markers_per_minute, workdir):
+    """Замеры всех этапов для записи из ``n_rows`` строк; возвращает список результатов"""
+    from channel_plot import DISPLAY_OPTIONS, mean_sem_png, render_channel_png
+    from markers import cluster_markers
+    from mean_sem import block_mean_sem, carry_markers_forward
+    from range_figure import build_range_figure
+    from recording import read_recording
+    from table_export import write_excel
+
+    text = generate_recording(n_rows, markers_per_minute=markers_per_minute, seed=n_rows, trailing_rate=0.3)
+    data = text.encode("utf-8")
+    results = []
+
+    def record(stage, function, n_items=n_rows):
+        timings, result = measure(function, repeat)
+        best = min(timings)
+        results.append({
+            "stage": stage,
+            "rows": n_rows,
+            "repeat": repeat,
+            "seconds_min": best,
+            "seconds_median": statistics.median(timings),
+            "rows_per_second": n_items / best if best else None,
+        })
+        print(f"{n_rows:>9} строк  {stage:<22} {best * 1000:10.1f} мс")
+        return result
+
+    recording = record("parse", lambda: read_recording(data))
+    df = record("frame", lambda: recording.to_frame())
+    _, df_mean_sem, block_times = record("mean_sem", lambda: block_mean_sem(df, GROUPS, BANDS, window_size))
+    df_clean = record("carry_markers_forward", lambda: carry_markers_forward(df_mean_sem))
+
+    marker_seconds, marker_labels = recording.marker_table()
+    record("cluster_markers", lambda: cluster_markers(marker_seconds, marker_labels))
+
+    record("matplotlib_channel", lambda: render_channel_png(recording, GROUPS[0], 3, **DISPLAY_OPTIONS))
+    record("matplotlib_mean_sem", lambda: mean_sem_png("", window_size, df_clean, block_times, GROUPS[0],
+                                                       BANDS, True, **DISPLAY_OPTIONS))
+
+    # Plotly: построение фигуры и её сериализация (то, что уходит в браузер)
+    seconds = recording.seconds
+    for mode, use_webgl in (("svg", False), ("webgl", True)):
+        record(f"plotly_{mode}", lambda: build_range_figure(recording, GROUPS[0], seconds[0], seconds[-1],
+                                                            use_webgl)[0].to_json())
+
+    excel_path = Path(workdir) / f"bench_{n_rows}.xlsx"
+    record("excel_export", lambda: write_excel(excel_path, {"MEAN_SEM": df_clean}), n_items=len(df_clean))
+    for result in results:
+        result["markers"] = len(marker_seconds)
+    return results
+
+
+def environment():
+    """Версии и машина — чтобы сравнивать только сопоставимые замеры"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    import matplotlib
+    import plotly
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "matplotlib": matplotlib.__version__,
+        "plotly": plotly.__version__,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры скорости этапов обработки записей OEEG")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="default",
+                        help="набор размеров и плотности маркеров; --sizes и --markers-per-minute его уточняют")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        help="размеры записей в строках (секундах); по умолчанию 1, 10 и 50 часов")
+    parser.add_argument("--repeat", type=int, default=3, help="сколько раз повторять каждый замер")
+    parser.add_argument("--window", type=int, default=10, help="размер окна MEAN/SEM")
+    parser.add_argument("--markers-per-minute", type=float, help="плотность маркеров")
+    parser.add_argument("--output", default="bench_results.json", help="файл с результатами (JSON)")
+    parser.add_argument("--generate", metavar="FILE",
+                        help="только записать синтетическую запись размера --sizes[0] в FILE")
+    args = parser.parse_args(argv)
+    for name, value in PRESETS[args.preset].items():
+        if getattr(args, name) is None:
+            setattr(args, name, value)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.generate:
+        Path(args.generate).write_text(
+            generate_recording(args.sizes[0], markers_per_minute=args.markers_per_minute), encoding="utf-8")
+        print(f"Записано {args.sizes[0]} строк в {args.generate}")
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_rows in args.sizes:
+            results += benchmark_size(n_rows, args.repeat, args.window, args.markers_per_minute, workdir)
+
+    report = {"environment": environment(), "preset": args.preset, "results": results}
+    Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Результаты записаны в {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,466 @@
+"""
+Графики каналов: исходные диапазоны («Построение графика»), MEAN±SEM
+(«Математический анализ») и кэш готовых PNG.
+
+Фигура строится через ``matplotlib.figure.Figure`` без pyplot: она не
+регистрируется в глобальном списке фигур, не зависит от «текущих осей»
+других потоков и освобождается сразу после сохранения в PNG.
+
+matplotlib импортируется при первом построении графика, а не при импорте
+модуля: боковая панель берёт отсюда только настройки, и страницы без
+графиков matplotlib не загружают.
+"""
+
+import io
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import numpy as np
+
+from markers import MIN_DISTANCE, cluster_markers
+from recording import BANDS, open_sidecar, read_recording
+from result_cache import load_bytes, store_bytes
+
+BAND_COLORS = {
+    "УПП(<0.5Hz)": "#000000",
+    "Delta(0.5-4)": "#ff0000",
+    "Theta(4-7)": "#7fb310",
+    "Alpha(8-14)": "#4f2186",
+    "Beta(14-30)": "#009cca",
+    "Gamma(30-95)": "#CDA434"
+}
+
+# Параметры PNG для показа на странице (как у st.pyplot) и для сохранения в файл
+DISPLAY_OPTIONS = {"dpi": 200, "bbox_inches": "tight"}
+SAVE_OPTIONS = {}
+
+# Вертикальное расстояние между сгруппированными маркерами по умолчанию
+DEFAULT_MARKER_SPACING = 3
+
+# Форматы и разрешение по умолчанию для пакетного сохранения всех каналов
+EXPORT_FORMATS = ("PNG", "SVG", "PDF")
+EXPORT_DPI = 100
+
+# Сколько готовых картинок держать в памяти процесса
+FIGURE_CACHE_SIZE = 48
+
+# Число процессов для фоновой отрисовки всех каналов
+PRERENDER_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+_pool = None
+_pool_lock = threading.Lock()
+# Идущие фоновые отрисовки и итоги последних законченных: (готово, всего, ошибок)
+_jobs = {}
+_finished = OrderedDict()
+
+
+def build_channel_figure(recording, selected, marker_spacing, bands=BANDS):
+    """Строит фигуру канала ``selected`` со всеми диапазонами и маркерами"""
+    import matplotlib
+    import matplotlib.ticker as ticker
+    from matplotlib.figure import Figure
+
+    df = recording.frame
+    matplotlib.rcParams['font.family'] = 'DejaVu Sans'
+    fig = Figure(figsize=(15, 5))
+    ax1 = fig.subplots()
+    fig.subplots_adjust(bottom=0.15, top=0.95)  # Уменьшаем отступы графика
+    ax2 = ax1.twinx()
+
+    # Сначала построим графики (все кроме УПП)
+    for band in bands:
+        col = (selected, band)
+        if col in df.columns:
+            y = df[col]
+            c = BAND_COLORS.get(band)
+            if band != "УПП(<0.5Hz)":
+                ax1.plot(df[('Seconds', '')], y, label=band, color=c, linewidth=3, zorder=5)
+
+    # Группируем метки, близкие по времени (ближе MIN_DISTANCE секунд к первой метке группы)
+    seconds, markers = recording.marker_table()
+    marker_positions = cluster_markers(seconds, markers, MIN_DISTANCE)
+
+    # Настройка осей и легенды с более компактным размещением
+    l1, lab1 = ax1.get_legend_handles_labels()
+    l2, lab2 = ax2.get_legend_handles_labels()
+    ax1.legend(l1 + l2, lab1 + lab2,
+               loc="upper center", bbox_to_anchor=(0.5, -0.1), ncol=6, frameon=False, fontsize=9)
+    ax1.yaxis.set_major_locator(ticker.MultipleLocator(5))  # Фиксированные деления на оси Y
+    ax1.set_xlim(left=-10)  # фиксируем только нижнюю границу X
+    ax2.set_xlim(left=-10)
+    ax1.relim()  # пересчитаем по Y
+    ax1.autoscale_view()
+    ax2.relim()
+    ax2.autoscale_view()
+    ax1.set_xlabel('Время записи, с', fontsize=10)
+    ax1.set_ylabel('Амплитуда ЭЭГ, мкВ', fontsize=10)
+    ax2.set_ylabel('Амплитуда УПП, мкВ', fontsize=10)
+    # Заголовок и сетка — на верхних (правых) осях, как раньше делал plt.title/plt.grid
+    ax2.set_title(selected, pad=5)
+    ax2.grid(True, zorder=1)  # Сетка снизу всех графиков
+
+    # Теперь отрисовываем УПП после того, как графики настроены
+    for band in bands:
+        col = (selected, band)
+        if col in df.columns and band == "УПП(<0.5Hz)":
+            y = df[col]
+            c = BAND_COLORS.get(band)
+            ax2.plot(df[('Seconds', '')], y, label=band, color=c, linewidth=5, zorder=10)
+
+    # Увеличиваем верхний предел оси Y для размещения смещенных маркеров
+    y1_lim = ax1.get_ylim()
+    ax1.set_ylim(y1_lim[0], y1_lim[1] * 1.2)  # Увеличиваем верхний предел на 20%
+
+    # И только после этого отрисуем метки поверх всех графиков
+    y_top = ax1.get_ylim()[1] * 0.95  # Отступ для верхних меток
+
+    # Отрисовка меток с вертикальным смещением и стрелками
+    for group_x, group_markers in marker_positions.items():
+        # Рисуем вертикальную линию для группы
+        ax1.axvline(x=group_x, color='red', linestyle='--', alpha=0.5, zorder=20)
+
+        # Сортируем маркеры по времени для более стабильного отображения
+        sorted_markers = sorted(group_markers, key=lambda m: m[0])
+
+        # Отрисовываем метки для этой группы со смещением вниз по Y если их несколько
+        for i, (x, m) in enumerate(sorted_markers):
+            if len(sorted_markers) == 1:
+                # Если одна метка, просто отображаем ее без указателя
+                ax1.text(x, y_top, m,
+                         fontsize=12, ha='center', va='top', color='red', rotation=90,
+                         backgroundcolor='white', alpha=0.9,
+                         zorder=30)  # Увеличиваем zorder для отображения поверх всего
+            else:
+                # Для нескольких меток смещаем вниз и добавляем указатели
+                # Первая метка на самом верху, остальные сдвигаются вниз с отступом
+                y_offset = y_top * (1 - i * marker_spacing * 0.03)  # Смещение вниз пропорционально индексу
+
+                # Отрисовываем текстовую метку с высоким zorder
+                ax1.text(x, y_offset, m,
+                         fontsize=12, ha='center', va='top', color='red', rotation=90,
+                         backgroundcolor='white', alpha=0.9,
+                         zorder=30)  # Высокий zorder для отображения поверх всего
+
+                # Если это не первая метка, добавляем указатель
+                if i > 0:
+                    # Добавляем стрелку от смещенной метки к вертикальной линии
+                    ax1.annotate('',
+                                 xy=(group_x, y_top * 0.9),  # Конец стрелки у вертикальной линии
+                                 xytext=(x, y_offset * 0.95),  # Начало стрелки у метки
+                                 arrowprops=dict(arrowstyle='->', color='red', alpha=0.7, linewidth=1.5),
+                                 zorder=25)  # Высокий zorder для стрелки
+
+    fig.tight_layout()
+    return fig
+
+
+def build_mean_sem_figure(df_clean, block_times, selected, bands, show_sem):
+    """Строит график MEAN (и, если show_sem, SEM) канала ``selected`` по блокам"""
+    import matplotlib.ticker as ticker
+    from matplotlib.figure import Figure
+
+    x = np.array(block_times)
+
+    # Создаем фигуру с двумя осями (для разных диапазонов)
+    fig = Figure(figsize=(15, 6))
+    ax1 = fig.subplots()
+    ax2 = ax1.twinx()
+
+    # Построение графиков для каждого частотного диапазона
+    for band in bands:
+        mean_col = (selected, f"MEAN_{band}")
+        sem_col = (selected, f"SEM_{band}")
+
+        # Пропускаем, если колонка отсутствует
+        if mean_col not in df_clean.columns:
+            continue
+
+        # Фильтруем NaN значения
+        df_subset = df_clean[[mean_col, sem_col]].dropna()
+        y_vals = df_subset[mean_col].values
+
+        # Используем соответствующие x-координаты
+        x_subset = x[df_subset.index]
+
+        # Выбираем ось в зависимости от диапазона
+        ax = ax2 if band == "УПП(<0.5Hz)" else ax1
+
+        # Рисуем линию графика
+        ax.plot(x_subset, y_vals, label=band, color=BAND_COLORS[band],
+                linewidth=5 if band == "УПП(<0.5Hz)" else 3)
+
+        # Добавляем погрешности, если включено
+        if show_sem and sem_col in df_clean.columns:
+            sem_vals = df_subset[sem_col].values
+            ax.errorbar(x_subset, y_vals, yerr=sem_vals, ecolor=BAND_COLORS[band],
+                        elinewidth=1.5, capsize=3, linestyle='', alpha=0.7)
+
+    # Добавление маркеров
+    markers = df_clean[("Marker", "")].fillna('').astype(str).str.strip().values
+    for xi, mi in zip(x, markers):
+        if mi:
+            ax1.axvline(x=xi, color='red', linestyle='--', alpha=0.5)
+            ax1.text(xi, ax1.get_ylim()[1] * 0.95, mi,
+                     fontsize=10, ha='center', va='top', rotation=90,
+                     backgroundcolor='white', color='red')
+
+    # Настройка легенды
+    h1, l1 = ax1.get_legend_handles_labels()
+    h2, l2 = ax2.get_legend_handles_labels()
+    ax1.legend(h1 + h2, l1 + l2, loc="upper center", bbox_to_anchor=(0.5, -0.1), ncol=6, frameon=False)
+
+    # Настройка осей и сетки (сетка — на правых осях, как раньше делал plt.grid)
+    ax1.yaxis.set_major_locator(ticker.MultipleLocator(5))
+    ax1.set_xlabel('Время записи, с')
+    ax1.set_ylabel('Амплитуда ЭЭГ, мкВ')
+    ax2.set_ylabel('Амплитуда УПП, мкВ')
+    ax2.grid(True)
+    fig.tight_layout()
+
+    # Установка границ осей
+    ax1.set_xlim(0, x.max())
+    ax2.set_xlim(ax1.get_xlim())
+
+    return fig
+
+
+def _figure_png(fig, **savefig_options):
+    """Сохраняет фигуру в PNG и сразу освобождает её"""
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format="png", **savefig_options)
+    finally:
+        fig.clear()
+    return buffer.getvalue()
+
+
+def render_channel_png(recording, selected, marker_spacing, **savefig_options):
+    """Строит фигуру канала, сохраняет её в PNG и сразу освобождает"""
+    return _figure_png(build_channel_figure(recording, selected, marker_spacing), **savefig_options)
+
+
+def cache_key(digest, selected, marker_spacing, savefig_options):
+    return digest, selected, marker_spacing, tuple(sorted(savefig_options.items()))
+
+
+def cached_png(key):
+    """Готовая картинка из кэша или None; найденная запись становится самой свежей"""
+    with _cache_lock:
+        png = _cache.get(key)
+        if png is not None:
+            _cache.move_to_end(key)
+        return png
+
+
+def store_png(key, png):
+    """Кладёт картинку в кэш, вытесняя самые давно использованные"""
+    with _cache_lock:
+        _cache[key] = png
+        _cache.move_to_end(key)
+        while len(_cache) > FIGURE_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def channel_png(recording, selected, marker_spacing, **savefig_options):
+    """
+    PNG канала из кэша по (хэш записи, канал, расстояние между маркерами,
+    параметры PNG). Запись без хэша (растущая) рисуется каждый раз заново.
+    """
+    if not recording.digest:
+        return render_channel_png(recording, selected, marker_spacing, **savefig_options)
+    key = cache_key(recording.digest, selected, marker_spacing, savefig_options)
+    png = cached_png(key)
+    if png is None:
+        png = render_channel_png(recording, selected, marker_spacing, **savefig_options)
+        store_png(key, png)
+    return png
+
+
+def mean_sem_png(digest, window_size, df_clean, block_times, selected, bands, show_sem, **savefig_options):
+    """
+    PNG графика MEAN/SEM канала. Ключ — (хэш записи, окно, канал, SEM,
+    параметры PNG), а не содержимое таблиц; картинка ищется в памяти, затем
+    в кэше на диске, и только потом строится.
+    """
+    if not digest:
+        return _figure_png(build_mean_sem_figure(df_clean, block_times, selected, bands, show_sem),
+                           **savefig_options)
+    params = (int(window_size), selected, tuple(bands), bool(show_sem), tuple(sorted(savefig_options.items())))
+    key = ("mean_sem", digest) + params
+    png = cached_png(key)
+    if png is None:
+        png = load_bytes(digest, "mean_sem_plot", params)
+        if png is None:
+            png = _figure_png(build_mean_sem_figure(df_clean, block_times, selected, bands, show_sem),
+                              **savefig_options)
+            store_bytes(digest, "mean_sem_plot", params, png)
+        store_png(key, png)
+    return png
+
+
+def _render_in_worker(sidecar_dir, path, digest, selected, marker_spacing, savefig_options):
+    """Отрисовка в отдельном процессе: запись открывается из бинарной копии (или файла)"""
+    import matplotlib
+    matplotlib.use("Agg")
+    recording = open_sidecar(sidecar_dir, digest) if sidecar_dir is not None else None
+    if recording is None:
+        recording = read_recording(path, digest=digest)
+    return render_channel_png(recording, selected, marker_spacing, **savefig_options)
+
+
+def render_pool():
+    """Общий пул процессов для отрисовки графиков"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, а не fork: сервер Streamlit многопоточный, а matplotlib не потокобезопасен
+            _pool = ProcessPoolExecutor(max_workers=PRERENDER_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def submit_render(fn, *args):
+    """
+    Отправляет задачу в общий пул. Если процесс пула упал (например, его
+    убили по памяти), пул сломан навсегда: он заменяется новым, и задача
+    отправляется ещё раз.
+    """
+    global _pool
+    pool = render_pool()
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        pool.shutdown(wait=False)
+        return render_pool().submit(fn, *args)
+
+
+def prerender_channels(recording, channels, marker_spacing, **savefig_options):
+    """
+    Запускает фоновую отрисовку всех ``channels`` в пуле процессов и кладёт
+    готовые PNG в кэш. Пока отрисовка идёт, повторный вызов для тех же
+    параметров ничего не делает; после неё заново рисуются только картинки,
+    вытесненные из кэша. Каналы, которые не удалось нарисовать, повторно не
+    рисуются. Записи без хэша (растущие) заранее не рисуются: кэшировать их нечем.
+    """
+    if not recording.digest:
+        return
+    job_key = cache_key(recording.digest, None, marker_spacing, savefig_options)
+    with _cache_lock:
+        if job_key in _jobs or _finished.get(job_key, (0, 0, 0))[2]:
+            return
+    missing = [(selected, cache_key(recording.digest, selected, marker_spacing, savefig_options))
+               for selected in channels]
+    missing = [(selected, key) for selected, key in missing if cached_png(key) is None]
+    if not missing:
+        return
+    with _cache_lock:
+        if job_key in _jobs:
+            return
+        job = _jobs[job_key] = {"total": len(missing), "done": 0, "failed": 0}
+        _finished.pop(job_key, None)
+
+    def finish(key, png):
+        if png is not None:
+            store_png(key, png)
+        with _cache_lock:
+            job["failed" if png is None else "done"] += 1
+            if job["done"] + job["failed"] == job["total"]:
+                # Отрисовка закончена: в _jobs остаются только идущие задания
+                del _jobs[job_key]
+                _finished[job_key] = (job["done"], job["total"], job["failed"])
+                while len(_finished) > FIGURE_CACHE_SIZE:
+                    _finished.popitem(last=False)
+
+    for selected, key in missing:
+        try:
+            future = submit_render(_render_in_worker, recording.sidecar_dir, recording.path,
+                                   recording.digest, selected, marker_spacing, savefig_options)
+        except Exception:
+            # Задача не ушла в пул — канал считается ненарисованным, задание всё равно завершится
+            finish(key, None)
+            continue
+        future.add_done_callback(
+            lambda future, key=key: finish(key, None if future.exception() is not None else future.result()))
+
+
+def prerender_progress(recording, marker_spacing, **savefig_options):
+    """(готово, всего, ошибок) для последней фоновой отрисовки или None, если её не было"""
+    job_key = cache_key(recording.digest, None, marker_spacing, savefig_options)
+    with _cache_lock:
+        job = _jobs.get(job_key)
+        if job is None:
+            return _finished.get(job_key)
+        return job["done"], job["total"], job["failed"]
+
+
+def save_figure(fig, output_path, fmt="PNG", dpi=EXPORT_DPI):
+    """Сохраняет фигуру в файл формата ``fmt`` и сразу освобождает её"""
+    try:
+        fig.savefig(output_path, format=fmt.lower(), dpi=dpi)
+    finally:
+        fig.clear()
+    return output_path
+
+
+def _export_channel_in_worker(sidecar_dir, path, digest, selected, marker_spacing, output_path, fmt, dpi):
+    """Сохранение графика канала в файл в отдельном процессе"""
+    import matplotlib
+    matplotlib.use("Agg")
+    recording = open_sidecar(sidecar_dir, digest) if sidecar_dir is not None else None
+    if recording is None:
+        recording = read_recording(path, digest=digest)
+    return save_figure(build_channel_figure(recording, selected, marker_spacing), output_path, fmt, dpi)
+
+
+def _export_mean_sem_in_worker(df_channel, block_times, selected, bands, show_sem, output_path, fmt, dpi):
+    """Сохранение графика MEAN/SEM канала в файл в отдельном процессе"""
+    import matplotlib
+    matplotlib.use("Agg")
+    return save_figure(build_mean_sem_figure(df_channel, block_times, selected, bands, show_sem),
+                       output_path, fmt, dpi)
+
+
+def export_channels(recording, channels, dest_dir, marker_spacing, fmt="PNG", dpi=EXPORT_DPI):
+    """
+    Сохраняет графики всех ``channels`` в ``dest_dir/<канал>.<формат>``
+    в пуле процессов. Возвращает список задач (futures) с путями файлов.
+    """
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    return [
+        submit_render(_export_channel_in_worker, recording.sidecar_dir, recording.path, recording.digest,
+                      selected, marker_spacing, dest_dir / f"{selected}.{fmt.lower()}", fmt, dpi)
+        for selected in channels
+    ]
+
+
+def export_mean_sem(df_clean, block_times, channels, bands, dest_dir, window_size, fmt="PNG", dpi=EXPORT_DPI):
+    """
+    Сохраняет графики MEAN/SEM всех ``channels`` — с погрешностями и без —
+    в ``dest_dir`` под теми же именами, что и кнопка одного графика.
+    В процессы уходят только колонки нужного канала. Возвращает список задач.
+    """
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    futures = []
+    for selected in channels:
+        columns = [("Seconds", ""), ("Marker", "")] + [
+            col for col in df_clean.columns if col[0] == selected and col[1].startswith(("MEAN_", "SEM_"))
+        ]
+        df_channel = df_clean[columns]
+        for show_sem in (True, False):
+            suffix = f"{selected}_mean_sem_{window_size}" if show_sem else f"{selected}_mean_{window_size}"
+            futures.append(submit_render(_export_mean_sem_in_worker, df_channel, block_times, selected, bands,
+                                         show_sem, dest_dir / f"{suffix}.{fmt.lower()}", fmt, dpi))
+    return futures
@@ -0,0 +1,42 @@
+"""
+Прореживание рядов для отрисовки с сохранением минимумов и максимумов.
+
+Диапазон строк делится на ``n_bins`` равных корзин, в каждой оставляются
+точки минимума и максимума: огибающая сигнала и все пики остаются на
+графике, а в браузер уходит не больше ``2 · n_bins`` точек на линию.
+"""
+
+import numpy as np
+
+# Сколько точек на линию отправляем в браузер
+MAX_POINTS_PER_TRACE = 4000
+
+
+def minmax_indices(y, start=0, stop=None, max_points=MAX_POINTS_PER_TRACE):
+    """
+    Номера строк ``y[start:stop]``, которые нужно нарисовать.
+
+    Если в диапазоне не больше ``max_points`` строк, возвращаются все строки;
+    иначе — первая, последняя и точки минимума и максимума каждой корзины.
+    """
+    stop = len(y) if stop is None else stop
+    n_rows = stop - start
+    if n_rows <= max_points:
+        return np.arange(start, stop)
+
+    n_bins = max(max_points // 2 - 1, 1)
+    bin_size = -(-n_rows // n_bins)
+    padded = np.empty(n_bins * bin_size, dtype=np.float64)
+    padded[:n_rows] = y[start:stop]
+    # Хвост последней корзины заполняем её последним значением, чтобы не сдвинуть экстремумы
+    padded[n_rows:] = padded[n_rows - 1]
+    padded = padded.reshape(n_bins, bin_size)
+
+    # NaN не должен становиться экстремумом: подменяем на значение, которое никогда не победит
+    low = np.where(np.isnan(padded), np.inf, padded).argmin(axis=1)
+    high = np.where(np.isnan(padded), -np.inf, padded).argmax(axis=1)
+    offsets = np.arange(n_bins) * bin_size
+    picked = np.concatenate(([0, n_rows - 1], offsets + low, offsets + high))
+    picked = np.unique(np.minimum(picked, n_rows - 1))
+    return picked + start
+
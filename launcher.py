@@ -4,6 +4,7 @@ OEEG Plot Streamlit Launcher
 Специальный лаунчер для Streamlit приложения (совместимый с PyInstaller)
 """
 
+import multiprocessing
 import os
 import sys
 import subprocess
@@ -12,6 +13,33 @@ import time
 import webbrowser
 from pathlib import Path
 
+# Момент запуска лаунчера — от него считается время запуска приложения
+LAUNCHER_STARTED = time.time()
+
+# Шаг опроса готовности сервера, с
+READY_POLL_INTERVAL = 0.05
+
+# Строка, которую Streamlit печатает, когда сервер уже слушает порт
+READY_LINE = "You can now view"
+
+# Префикс строк с отметками времени запуска от процесса Streamlit
+STARTUP_MARK = "OEEG_STARTUP"
+
+# Запуск Streamlit в дочернем процессе с отметками: поднялся интерпретатор,
+# импортирован Streamlit. Там же запускается прогрев (warmup.py), если лаунчер
+# передал порт. Аргументы командной строки — как у «streamlit»
+STREAMLIT_BOOTSTRAP = (
+    "import os, sys, time\n"
+    f"print('{STARTUP_MARK} interpreter', time.time(), flush=True)\n"
+    "from streamlit.web import cli\n"
+    f"print('{STARTUP_MARK} imports', time.time(), flush=True)\n"
+    "if os.environ.get('OEEG_WARMUP_PORT'):\n"
+    "    import warmup\n"
+    "    warmup.start_warmup(int(os.environ['OEEG_WARMUP_PORT']))\n"
+    "sys.argv[0] = 'streamlit'\n"
+    "sys.exit(cli.main())\n"
+)
+
 
 def get_resource_path(relative_path):
     """Получает правильный путь к ресурсам для PyInstaller"""
@@ -88,25 +116,93 @@ def check_streamlit_installation():
         return False
 
 
-def wait_for_server(url, timeout=30):
-    """Ждет запуска Streamlit сервера"""
+class StartupTimer:
+    """Отметки времени запуска приложения и отчёт по этапам"""
+
+    # Этапы отчёта: (отметка конца этапа, название)
+    STAGES = (
+        ("spawn", "лаунчер"),
+        ("interpreter", "интерпретатор"),
+        ("imports", "импорт Streamlit"),
+        ("ready", "запуск сервера"),
+        ("first_page", "первая страница"),
+    )
+
+    def __init__(self):
+        self.marks = {"launcher": LAUNCHER_STARTED}
+
+    def mark(self, name, when=None):
+        self.marks.setdefault(name, time.time() if when is None else when)
+
+    def handle_line(self, line):
+        """Разбирает строку вывода Streamlit; True — строка была отметкой времени"""
+        if not line.startswith(STARTUP_MARK):
+            return False
+        try:
+            _, name, when = line.split()
+            self.mark(name, float(when))
+        except ValueError:
+            return False
+        if name == "first_page":
+            print(self.report())
+        return True
+
+    def report(self):
+        """Время этапов, отмеченных на данный момент, и общее время от запуска лаунчера"""
+        parts, previous = [], self.marks["launcher"]
+        for name, title in self.STAGES:
+            if name in self.marks:
+                parts.append(f"{title} {self.marks[name] - previous:.2f} с")
+                previous = self.marks[name]
+        return f"⏱ Запуск: {', '.join(parts)}; всего {previous - self.marks['launcher']:.2f} с"
+
+
+def wait_for_server(url, timeout=30, ready_event=None):
+    """
+    Ждёт запуска Streamlit сервера: ответа «ok» на /_stcore/health или
+    строки о готовности в выводе процесса (``ready_event``)
+    """
     import urllib.request
-    import urllib.error
 
     print("Ожидание запуска сервера...")
-    start_time = time.time()
+    health_url = url.rstrip("/") + "/_stcore/health"
+    deadline = time.monotonic() + timeout
 
-    while time.time() - start_time < timeout:
+    while time.monotonic() < deadline:
+        if ready_event is not None and ready_event.is_set():
+            return True
         try:
-            response = urllib.request.urlopen(url, timeout=2)
-            if response.getcode() == 200:
+            with urllib.request.urlopen(health_url, timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            # Порт ещё не слушается или сервер не готов (503)
+            pass
+        if ready_event is not None:
+            if ready_event.wait(READY_POLL_INTERVAL):
                 return True
-        except (urllib.error.URLError, OSError, Exception):
-            time.sleep(1)
+        else:
+            time.sleep(READY_POLL_INTERVAL)
 
     return False
 
 
+def open_browser_when_ready(url, timeout, timer, ready_event=None):
+    """Открывает браузер, как только сервер готов, и печатает время запуска"""
+    if wait_for_server(url, timeout=timeout, ready_event=ready_event):
+        timer.mark("ready")
+        print(f"✅ Сервер запущен! Открываем браузер...")
+        print(timer.report())
+        try:
+            webbrowser.open(url)
+        except Exception as e:
+            print(f"⚠️ Не удалось открыть браузер: {e}")
+            print(f"Откройте браузер вручную: {url}")
+    else:
+        print("⚠️ Не удалось дождаться запуска сервера")
+        print(f"Попробуйте открыть браузер вручную: {url}")
+
+
 def run_streamlit_app(main_path):
     """Запускает Streamlit приложение"""
     try:
@@ -139,6 +235,7 @@ def run_streamlit_app(main_path):
         # Параметры для Streamlit
         port = 8501
         url = f"http://localhost:{port}"
+        timer = StartupTimer()
 
         print(f"Запуск Streamlit приложения...")
         print(f"URL: {url}")
@@ -163,20 +260,13 @@ def run_streamlit_app(main_path):
 
                 print("Запуск через встроенный Streamlit...")
 
-                # Открываем браузер в отдельном потоке
-                def open_browser():
-                    if wait_for_server(url, timeout=30):
-                        print(f"✅ Сервер запущен! Открываем браузер...")
-                        try:
-                            webbrowser.open(url)
-                        except Exception as e:
-                            print(f"⚠️ Не удалось открыть браузер: {e}")
-                            print(f"Откройте браузер вручную: {url}")
-                    else:
-                        print("⚠️ Не удалось дождаться запуска сервера")
-                        print(f"Попробуйте открыть браузер вручную: {url}")
-
-                browser_thread = threading.Thread(target=open_browser, daemon=True)
+                # Открываем браузер в отдельном потоке. Интерпретатор и Streamlit
+                # здесь общие с лаунчером, поэтому в отчёте только время до сервера
+                timer.mark("spawn")
+                from warmup import start_warmup
+                start_warmup(port)
+                browser_thread = threading.Thread(target=open_browser_when_ready, args=(url, 30, timer),
+                                                  daemon=True)
                 browser_thread.start()
 
                 # Запускаем Streamlit напрямую
@@ -201,7 +291,7 @@ def run_streamlit_app(main_path):
 
         # Команда для запуска Streamlit через subprocess
         cmd = [
-            python_executable, "-m", "streamlit", "run",
+            python_executable, "-c", STREAMLIT_BOOTSTRAP, "run",
             str(main_path),
             "--server.port", str(port),
             "--server.headless", "true",
@@ -211,10 +301,17 @@ def run_streamlit_app(main_path):
             "--server.enableXsrfProtection", "false"
         ]
 
-        print(f"Выполняемая команда: {' '.join(cmd)}")
+        # Код запуска с отметками времени равнозначен «-m streamlit»; печатаем короткую форму
+        print(f"Выполняемая команда: {python_executable} -m streamlit {' '.join(cmd[3:])}")
         print(f"Рабочая директория: {project_dir}")
 
+        # Главная страница печатает отметку о первом построении
+        env['OEEG_STARTUP_MARKS'] = '1'
+        # Прогрев после запуска сервера (выключается OEEG_WARMUP=0)
+        env['OEEG_WARMUP_PORT'] = str(port)
+
         # Запускаем процесс
+        timer.mark("spawn")
         process = subprocess.Popen(
             cmd,
             env=env,
@@ -225,31 +322,23 @@ def run_streamlit_app(main_path):
             bufsize=1
         )
 
-        # Функция для вывода логов Streamlit
+        # Вывод логов Streamlit; по нему же видно, что сервер готов
+        ready_event = threading.Event()
+
         def print_output():
             for line in iter(process.stdout.readline, ''):
-                if line:
+                if line and not timer.handle_line(line):
+                    if READY_LINE in line:
+                        ready_event.set()
                     print(f"[Streamlit] {line.rstrip()}")
 
         # Запускаем вывод логов в отдельном потоке
         output_thread = threading.Thread(target=print_output, daemon=True)
         output_thread.start()
 
-        # Ждем запуска сервера и открываем браузер
-        def open_browser():
-            if wait_for_server(url, timeout=45):
-                print(f"✅ Сервер запущен! Открываем браузер...")
-                try:
-                    webbrowser.open(url)
-                except Exception as e:
-                    print(f"⚠️ Не удалось открыть браузер: {e}")
-                    print(f"Откройте браузер вручную: {url}")
-            else:
-                print("⚠️ Не удалось дождаться запуска сервера")
-                print(f"Попробуйте открыть браузер вручную: {url}")
-
         # Запускаем открытие браузера в отдельном потоке
-        browser_thread = threading.Thread(target=open_browser, daemon=True)
+        browser_thread = threading.Thread(target=open_browser_when_ready, args=(url, 45, timer, ready_event),
+                                          daemon=True)
         browser_thread.start()
 
         # Ждем завершения процесса
@@ -327,6 +416,9 @@ def main():
 
 
 if __name__ == "__main__":
+    # Нужно для пула процессов фоновой отрисовки в собранном PyInstaller приложении
+    multiprocessing.freeze_support()
+
     try:
         main()
     except KeyboardInterrupt:
@@ -12,6 +12,18 @@ typing_extensions_deps = copy_metadata("typing_extensions")
 datas = [
     ('.\\main.py', '.'),
     ('.\\sidebar.py', '.'),
+    ('.\\recording.py', '.'),
+    ('.\\mean_sem.py', '.'),
+    ('.\\downsample.py', '.'),
+    ('.\\markers.py', '.'),
+    ('.\\channel_plot.py', '.'),
+    ('.\\batch.py', '.'),
+    ('.\\table_export.py', '.'),
+    ('.\\live.py', '.'),
+    ('.\\result_cache.py', '.'),
+    ('.\\range_figure.py', '.'),
+    ('.\\timing.py', '.'),
+    ('.\\warmup.py', '.'),
     ('.\\requirements.txt', '.'),
     ('.\\pages', 'pages'),
     ('.\\.streamlit', '.streamlit'),
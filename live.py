@@ -0,0 +1,139 @@
+"""
+Слежение за записью, которую прибор ещё пишет на диск.
+
+Файл читается с места, где закончилось прошлое чтение, и только до
+последней целой строки; новые строки разбираются тем же парсером, что и
+загруженные файлы, и дописываются в колоночные массивы с запасом ёмкости.
+После каждого обновления получается обычный объект Recording, массивы
+которого — срезы этих буферов, так что страницы работают с ним как с
+загруженной записью. Хэша содержимого у такой записи нет (пустой digest):
+её результаты не попадают в общие кэши ни в памяти, ни на диске — файл
+может продолжиться или начаться заново с тем же именем и тем же числом
+строк. Собранные строки MEAN/SEM и картинки текущего состояния хранит сам
+RecordingTail.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from mean_sem import BlockAccumulator
+from recording import (BANDS, GROUPS, VALUE_DTYPE, Recording, clock_to_datetime, normalize_markers,
+                       read_table, unwrap_midnight)
+
+# Начальная ёмкость буферов в строках; дальше она удваивается
+INITIAL_CAPACITY = 4096
+
+
+def _grow(buffer, used, extra):
+    """Буфер, в который помещается ещё ``extra`` строк (с удвоением ёмкости)"""
+    if used + extra <= len(buffer):
+        return buffer
+    capacity = max(INITIAL_CAPACITY, len(buffer))
+    while capacity < used + extra:
+        capacity *= 2
+    grown = np.empty((capacity,) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:used] = buffer[:used]
+    return grown
+
+
+class RecordingTail:
+    """Растущая запись в файле ``path``; :meth:`poll` дочитывает новые строки"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.rows = 0
+        self._start = None
+        self._last_clock = None
+        self._days = 0
+        self._seconds = np.empty(0, dtype=np.float64)
+        self._time = np.empty(0, dtype="datetime64[ns]")
+        self._markers = np.empty(0, dtype=object)
+        self._values = np.empty((0, len(GROUPS) * len(BANDS)), dtype=VALUE_DTYPE)
+        self._marker_rows = np.empty(0, dtype=np.int64)
+        self._n_markers = 0
+        self._accumulators = {}
+        self._images = {}
+        self.recording = None
+
+    def poll(self):
+        """Дочитывает файл; возвращает число новых строк (0 — ничего не изменилось)"""
+        size = self.path.stat().st_size
+        if size < self.offset:
+            # Файл перезаписан заново — начинаем с начала
+            self.reset()
+        if size == self.offset:
+            return 0
+
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        # Последняя строка может быть дописана не до конца — оставляем её на следующий раз
+        end = data.rfind(b"\n")
+        if end < 0:
+            return 0
+        self.offset += end + 1
+        try:
+            table = read_table(data[:end + 1])
+        except pd.errors.EmptyDataError:
+            return 0
+        if table.empty:
+            return 0
+        self._append(table)
+        return len(table)
+
+    def _append(self, table):
+        clock = clock_to_datetime(table[0].to_numpy())
+        time = unwrap_midnight(clock, previous=self._last_clock, days=self._days)
+        self._last_clock = clock.iloc[-1]
+        self._days = int((time.iloc[-1] - clock.iloc[-1]) / pd.Timedelta(days=1))
+        if self._start is None:
+            self._start = time.iloc[0]
+
+        n_new, used = len(table), self.rows
+        rows = slice(used, used + n_new)
+        self._seconds = _grow(self._seconds, used, n_new)
+        self._seconds[rows] = (time - self._start).dt.total_seconds().to_numpy()
+        self._time = _grow(self._time, used, n_new)
+        self._time[rows] = time.to_numpy()
+        self._markers = _grow(self._markers, used, n_new)
+        self._markers[rows] = normalize_markers(table[1])
+        self._values = _grow(self._values, used, n_new)
+        self._values[rows] = table.iloc[:, 2:].to_numpy(dtype=VALUE_DTYPE)
+
+        new_markers = np.flatnonzero(self._markers[rows] != "") + used
+        self._marker_rows = _grow(self._marker_rows, self._n_markers, len(new_markers))
+        self._marker_rows[self._n_markers:self._n_markers + len(new_markers)] = new_markers
+        self._n_markers += len(new_markers)
+        self.rows += n_new
+        # Картинки прошлого состояния записи устарели
+        self._images = {}
+
+        n = self.rows
+        self.recording = Recording(
+            start=self._start,
+            seconds=self._seconds[:n],
+            markers=self._markers[:n],
+            values=self._values[:n],
+            name=self.path.name,
+            path=self.path,
+            time=self._time[:n],
+            marker_rows=self._marker_rows[:self._n_markers],
+        )
+
+    def accumulator(self, window_size):
+        """Накопитель MEAN/SEM для размера окна; собранные раньше строки блоков не пересчитываются"""
+        if window_size not in self._accumulators:
+            self._accumulators[window_size] = BlockAccumulator(window_size)
+        return self._accumulators[window_size]
+
+    def image(self, key, render):
+        """PNG для текущего состояния записи: ``render()`` вызывается один раз на обновление файла"""
+        if key not in self._images:
+            self._images[key] = render()
+        return self._images[key]
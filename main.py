@@ -1,8 +1,12 @@
 
+import os
+import time
 from pathlib import Path
 
 import streamlit as st
 
+from timing import begin_run
+
 #Настройки страницы
 st.set_page_config(
     page_title="Загрузка файла",
@@ -34,18 +38,31 @@ with st.sidebar:
         "Выберите текстовый файл",
         type=["txt"]
     )
+    st.checkbox(
+        "Заранее строить графики всех каналов",
+        key="prerender_channels",
+        help="После загрузки файла графики всех девяти каналов строятся в фоновых процессах, "
+             "и переключение каналов на странице «Построение графика» происходит мгновенно"
+    )
 
 # --- Логика загрузки файла ---
+# На главной таблицы замеров нет, разбор файла попадает только в журнал OEEG_TIMING_LOG
+begin_run("main")
 if 'uploaded_file' in locals() and uploaded_file is not None:
-    content = uploaded_file.getvalue().decode("utf-8")
-    st.session_state['file_content'] = content
-    st.session_state['uploaded_name'] = uploaded_file.name
+    # Разбор записи (numpy, pandas) нужен только после загрузки файла
+    from channel_plot import DEFAULT_MARKER_SPACING
+    from sidebar import prerender_summary, store_upload
 
-    base_name = Path(uploaded_file.name).stem
-    output_dir = Path(base_name)
-    output_dir.mkdir(parents=True, exist_ok=True)
+    recording = store_upload(uploaded_file)
+    if recording is not None:
+        base_name = Path(uploaded_file.name).stem
+        output_dir = Path(base_name)
+        output_dir.mkdir(parents=True, exist_ok=True)
 
-    st.success(f"Файл «{uploaded_file.name}» загружен и готов к анализу.")
+        st.success(f"Файл «{uploaded_file.name}» загружен и готов к анализу.")
+        if st.session_state.get("prerender_channels"):
+            with st.sidebar:
+                prerender_summary(recording, st.session_state.get("marker_spacing", DEFAULT_MARKER_SPACING))
 
 # --- Основной контент Main ---
 st.title("Добро пожаловать!")
@@ -53,3 +70,7 @@ st.write(
     "В этом приложении вы можете загружать текстовые файлы и переходить к разделам "
     "Построение графика, Анализ графика и Математический анализ через меню слева."
 )
+
+# Отметка для отчёта лаунчера о времени запуска (печатается один раз за процесс)
+if os.environ.pop("OEEG_STARTUP_MARKS", None):
+    print("OEEG_STARTUP first_page", time.time(), flush=True)
@@ -0,0 +1,37 @@
+"""
+Группировка близких по времени маркеров для подписи на графиках.
+"""
+
+import numpy as np
+
+# Минимальное расстояние между группами меток в секундах
+MIN_DISTANCE = 5
+
+
+def cluster_markers(seconds, labels, min_distance=MIN_DISTANCE):
+    """
+    Группирует маркеры: группа начинается с первого ещё не распределённого
+    маркера и забирает все маркеры, отстоящие от него меньше чем на
+    ``min_distance`` секунд.
+
+    Маркеры сортируются по времени, границы групп находятся двоичным поиском,
+    поэтому после сортировки работа линейна по числу групп. Возвращает
+    словарь ``время группы → [(время, метка), ...]`` в порядке времени;
+    пустые метки пропускаются.
+    """
+    seconds = np.asarray(seconds, dtype=np.float64)
+    labels = np.asarray(labels, dtype=object)
+    keep = np.array([bool(m) for m in labels], dtype=bool)
+    seconds, labels = seconds[keep], labels[keep]
+
+    order = np.argsort(seconds, kind="stable")
+    seconds, labels = seconds[order], labels[order]
+
+    groups = {}
+    start = 0
+    while start < len(seconds):
+        anchor = seconds[start]
+        stop = int(np.searchsorted(seconds, anchor + min_distance, side="left"))
+        groups[anchor] = list(zip(seconds[start:stop], labels[start:stop]))
+        start = stop
+    return groups
@@ -0,0 +1,265 @@
+"""
+Расчёт MEAN и SEM по блокам из ``window_size`` подряд идущих строк.
+
+Все 54 колонки (группа × диапазон) считаются за один проход по двумерному
+массиву через ``np.add.reduceat``; результат совпадает с поблочным
+``Series.mean()`` / ``Series.sem(ddof=1)``, пропуски (NaN) не учитываются.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def block_starts(n_rows, window_size):
+    """Номера первых строк блоков: 0, window_size, 2·window_size, ..."""
+    return np.arange(0, n_rows, window_size)
+
+
+def block_stats(values, window_size):
+    """
+    MEAN и SEM каждого блока для каждой колонки ``values`` (строки × колонки).
+
+    Возвращает (last_rows, means, sems): номер последней строки каждого блока
+    и матрицы (блоки × колонки). SEM блока из одного значения — NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_rows = len(values)
+    starts = block_starts(n_rows, window_size)
+    last_rows = np.minimum(starts + window_size, n_rows) - 1
+    if n_rows == 0:
+        empty = np.empty((0, values.shape[1]))
+        return last_rows, empty, empty.copy()
+
+    missing = np.isnan(values)
+    filled = np.where(missing, 0.0, values)
+    counts = np.add.reduceat(~missing, starts, axis=0).astype(np.float64)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.add.reduceat(filled, starts, axis=0) / counts
+
+        # Второй проход по отклонениям от среднего блока — без потери точности
+        # на разности больших сумм
+        block_of_row = np.arange(n_rows) // window_size
+        deviations = np.where(missing, 0.0, values - means[block_of_row])
+        squares = np.add.reduceat(deviations * deviations, starts, axis=0)
+        sems = np.sqrt(squares / (counts - 1) / counts)
+    sems[counts < 2] = np.nan
+    return last_rows, means, sems
+
+
+def sweep_stats(values, window_sizes):
+    """
+    MEAN и SEM сразу для нескольких размеров окна.
+
+    Кумулятивные суммы значений, их квадратов и числа непропущенных значений
+    считаются один раз; статистика любого окна — разности этих сумм на
+    границах блоков. Значения предварительно центрируются по колонкам, чтобы
+    разность больших сумм квадратов не теряла точность. Возвращает словарь
+    ``window_size → (last_rows, means, sems)`` как у :func:`block_stats`.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_rows, n_cols = values.shape
+    missing = np.isnan(values)
+    with np.errstate(invalid="ignore"):
+        shift = np.nanmean(values, axis=0) if n_rows else np.zeros(n_cols)
+    shift = np.where(np.isnan(shift), 0.0, shift)
+    centered = np.where(missing, 0.0, values - shift)
+
+    def prefix(a):
+        out = np.zeros((n_rows + 1, n_cols))
+        np.cumsum(a, axis=0, out=out[1:])
+        return out
+
+    sum1 = prefix(centered)
+    sum2 = prefix(centered * centered)
+    count = prefix(~missing)
+
+    results = {}
+    for window_size in window_sizes:
+        starts = block_starts(n_rows, window_size)
+        ends = np.minimum(starts + window_size, n_rows)
+        n = count[ends] - count[starts]
+        s1 = sum1[ends] - sum1[starts]
+        s2 = sum2[ends] - sum2[starts]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = s1 / n + shift
+            squares = np.maximum(s2 - s1 * s1 / n, 0.0)
+            sems = np.sqrt(squares / (n - 1) / n)
+        sems[n < 2] = np.nan
+        results[window_size] = (ends - 1, means, sems)
+    return results
+
+
+def _value_columns(df, groups, bands):
+    return [(g, b) for g in groups for b in bands if (g, b) in df.columns]
+
+
+def value_matrix(df, groups, bands):
+    """Значения колонок (группа, диапазон), по которым считаются MEAN/SEM, как float64"""
+    return df[_value_columns(df, groups, bands)].to_numpy(dtype=np.float64)
+
+
+def _assemble(df, groups, columns, last_rows, means, sems):
+    """Раскладывает поблочные MEAN/SEM по строкам исходной таблицы"""
+    n_rows = len(df)
+    block_times = df[("Seconds", "")].to_numpy()[last_rows].tolist()
+
+    mean_full = np.full((n_rows, len(columns)), np.nan)
+    sem_full = np.full((n_rows, len(columns)), np.nan)
+    mean_full[last_rows] = means
+    sem_full[last_rows] = sems
+
+    mean_cols = [(g, f"MEAN_{b}") for g, b in columns]
+    sem_cols = [(g, f"SEM_{b}") for g, b in columns]
+    mean_block = pd.DataFrame(mean_full, index=df.index, columns=pd.MultiIndex.from_tuples(mean_cols))
+    sem_block = pd.DataFrame(sem_full, index=df.index, columns=pd.MultiIndex.from_tuples(sem_cols))
+
+    time_sec_marker = df[[("Time", ""), ("Seconds", ""), ("Marker", "")]]
+    ordered = []
+    for g in groups:
+        group_bands = [b for gg, b in columns if gg == g]
+        ordered += [(g, f"MEAN_{b}") for b in group_bands]
+        ordered += [(g, f"SEM_{b}") for b in group_bands]
+        ordered += [(g, b) for b in group_bands]
+
+    df_final = pd.concat([time_sec_marker, mean_block, sem_block, df[columns]], axis=1)
+    df_final = df_final[list(time_sec_marker.columns) + ordered]
+
+    mean_sem_cols = [col for col in ordered if col[1].startswith(("MEAN_", "SEM_"))]
+    df_mean_sem = df_final[list(time_sec_marker.columns) + mean_sem_cols]
+    return df_final, df_mean_sem, block_times
+
+
+class BlockAccumulator:
+    """
+    Таблица MEAN/SEM растущей записи (запись, которая ещё пишется).
+
+    Строки полных блоков вместе с перенесёнными в них маркерами собираются
+    один раз и запоминаются. При каждом обновлении считаются, собираются и
+    получают маркеры только строки, дописанные после последнего полного
+    блока (новые полные блоки и неполный последний), так что работа
+    пропорциональна числу новых строк.
+    """
+
+    def __init__(self, window_size):
+        self.window_size = window_size
+        self.reset()
+
+    def reset(self):
+        # Строк в уже собранных полных блоках
+        self.rows = 0
+        # Первая строка, маркеры которой ещё не перенесены в строку блока:
+        # за полными блоками без значений (все NaN) маркеры ждут следующего блока
+        self._carry_from = 0
+        self._clean = None
+        self._block_times = []
+
+    def update(self, recording, groups, bands):
+        """
+        (df_clean, block_times) для всей записи ``recording`` — то же, что
+        ``carry_markers_forward(block_mean_sem(...)[1])`` и block_times.
+        """
+        n_rows = len(recording)
+        if n_rows < self.rows:
+            # Запись стала короче (файл начат заново) — считаем с нуля
+            self.reset()
+        window_size = self.window_size
+        complete = n_rows // window_size * window_size
+
+        # Строки, которые ещё могут измениться: с первого неперенесённого маркера
+        part = recording.view(self._carry_from).to_frame(groups, bands)
+        columns = _value_columns(part, groups, bands)
+        offset = self.rows - self._carry_from
+        last_rows, means, sems = block_stats(part[columns].iloc[offset:].to_numpy(dtype=np.float64),
+                                             window_size)
+        _, df_mean_sem, block_times = _assemble(part, groups, columns, last_rows + offset, means, sems)
+        clean = carry_markers_forward(df_mean_sem)
+
+        # Полные блоки больше не меняются — запоминаем их строки и время
+        n_complete = (complete - self.rows) // window_size
+        has_data = ~np.isnan(means[:n_complete]).all(axis=1)
+        n_final = int(has_data.sum())
+        if n_final:
+            final = clean.iloc[:n_final]
+            self._clean = final if self._clean is None else pd.concat([self._clean, final], ignore_index=True)
+            self._carry_from = self.rows + (np.flatnonzero(has_data)[-1] + 1) * window_size
+        self._block_times += block_times[:n_complete]
+        self.rows = complete
+
+        pending = clean.iloc[n_final:]
+        if self._clean is None:
+            df_clean = pending.reset_index(drop=True)
+        elif len(pending):
+            df_clean = pd.concat([self._clean, pending], ignore_index=True)
+        else:
+            df_clean = self._clean
+        return df_clean, self._block_times + block_times[n_complete:]
+
+
+def block_mean_sem(df, groups, bands, window_size):
+    """
+    Таблицы MEAN/SEM для страницы «Математический анализ».
+
+    Возвращает (df_final, df_mean_sem, block_times): в df_final для каждой
+    группы идут колонки MEAN_*, SEM_* и исходные значения, MEAN/SEM
+    заполнены только в последней строке блока; df_mean_sem — то же без
+    исходных значений; block_times — Seconds последней строки каждого блока.
+    """
+    stats = block_stats(value_matrix(df, groups, bands), window_size)
+    return mean_sem_tables(df, groups, bands, stats)
+
+
+def mean_sem_tables(df, groups, bands, stats):
+    """Таблицы :func:`block_mean_sem` из уже посчитанных (last_rows, means, sems)"""
+    return _assemble(df, groups, _value_columns(df, groups, bands), *stats)
+
+
+def sweep_mean_sem(df, groups, bands, window_sizes):
+    """
+    То же, что :func:`block_mean_sem`, для нескольких размеров окна за один проход.
+
+    Возвращает словарь ``window_size → (df_final, df_mean_sem, block_times)``.
+    """
+    stats = sweep_stats(value_matrix(df, groups, bands), window_sizes)
+    return {
+        window_size: mean_sem_tables(df, groups, bands, stats[window_size])
+        for window_size in window_sizes
+    }
+
+
+def carry_markers_forward(df_mean_sem):
+    """
+    Переносит маркеры из строк без MEAN/SEM на ближайшую следующую строку
+    блока и оставляет только строки блоков.
+
+    Маркеры, попавшие внутрь блока, склеиваются через пробел в порядке
+    записи и ставятся перед собственным маркером строки блока; маркеры после
+    последней строки блока отбрасываются.
+    """
+    marker_col = ("Marker", "")
+    mean_sem_cols = [col for col in df_mean_sem.columns if col[1].startswith(("MEAN_", "SEM_"))]
+
+    has_data = df_mean_sem[mean_sem_cols].notna().to_numpy().any(axis=1)
+    data_rows = np.flatnonzero(has_data)
+    df_clean = df_mean_sem.iloc[data_rows].reset_index(drop=True)
+
+    markers = df_mean_sem[marker_col]
+    labels = markers.where(markers.notna(), "").astype(str).str.strip().to_numpy()
+    present = labels != ""
+
+    # Номер строки блока, к которой относится каждая строка таблицы
+    block_of_row = np.searchsorted(data_rows, np.arange(len(df_mean_sem)))
+    moved = present & ~has_data & (block_of_row < len(data_rows))
+    receiving = np.unique(block_of_row[moved])
+    if len(receiving):
+        in_receiving = present & np.isin(block_of_row, receiving)
+        joined = pd.Series(labels[in_receiving]).groupby(block_of_row[in_receiving], sort=True).agg(" ".join)
+        df_clean.loc[joined.index, marker_col] = joined.to_numpy()
+    return df_clean
+
+
+def mean_only(df_clean):
+    """Таблица для выгрузки «только MEAN»: время, маркер и колонки MEAN_* без SEM"""
+    time_cols = [("Time", ""), ("Seconds", ""), ("Marker", "")]
+    mean_cols = [col for col in df_clean.columns if col[1].startswith("MEAN_")]
+    return df_clean[time_cols + mean_cols].copy()
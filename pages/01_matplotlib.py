@@ -4,11 +4,6 @@ from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent))
 
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-from matplotlib.transforms import offset_copy
 
 # Уменьшаем отступы страницы с помощью CSS
 st.set_page_config(page_title="Построение графика", layout="wide", initial_sidebar_state="expanded")
@@ -52,14 +47,17 @@ st.markdown("""
         }
     </style>
 """, unsafe_allow_html=True)
-from sidebar import render_sidebar
+from sidebar import export_settings, render_sidebar, wait_for_export
+from recording import GROUPS, BANDS
+from channel_plot import DEFAULT_MARKER_SPACING, DISPLAY_OPTIONS, SAVE_OPTIONS, channel_png, export_channels
+from timing import stage
 
 # Заголовок страницы
 st.title("Построение графика")
-render_sidebar()
+render_sidebar("matplotlib")
 
 # Проверка наличия данных
-if 'file_content' not in st.session_state or 'uploaded_name' not in st.session_state:
+if 'recording' not in st.session_state or 'uploaded_name' not in st.session_state:
     st.warning("Сначала загрузите файл на главной странице!")
     st.stop()
 
@@ -70,36 +68,9 @@ output_dir = Path(base_name)
 output_dir.mkdir(parents=True, exist_ok=True)
 
 # Чтение и подготовка данных
-file_text = st.session_state['file_content']
-lines = [ln.strip() for ln in file_text.splitlines() if not ln.startswith('#')]
-groups = ["AVERAGE", "0[P3]15", "1[F3]16", "2[Cz]12", "3[P4]11",
-          "4[F4]10", "5[Fz]32", "6[T3]36", "7[T4]27"]
-bands = ["УПП(<0.5Hz)", "Delta(0.5-4)", "Theta(4-7)",
-         "Alpha(8-14)", "Beta(14-30)", "Gamma(30-95)"]
-
-columns = [('Time', ''), ('Marker', '')] + [(g, b) for g in groups for b in bands]
-data = []
-for line in lines:
-    parts = line.split()
-    if not line[-1].isnumeric(): parts = parts[:-1]
-    row = [parts[0], parts[1]] + [float(x) for x in parts[2:]]
-    data.append(row)
-df = pd.DataFrame(data, columns=pd.MultiIndex.from_tuples(columns))
-
-# Время → секунды
-df[('Time', '')] = pd.to_datetime(df[('Time', '')], format='%H:%M:%S')
-start = df[('Time', '')].iloc[0]
-df[('Seconds', '')] = (df[('Time', '')] - start).dt.total_seconds()
-
-# Цвета
-band_colors = {
-    "УПП(<0.5Hz)": "#000000",
-    "Delta(0.5-4)": "#ff0000",
-    "Theta(4-7)": "#7fb310",
-    "Alpha(8-14)": "#4f2186",
-    "Beta(14-30)": "#009cca",
-    "Gamma(30-95)": "#CDA434"
-}
+groups = GROUPS
+bands = BANDS
+df = st.session_state['recording'].frame
 
 # Определение доступных каналов
 available = [g for g in groups if (g, bands[0]) in df.columns]
@@ -152,118 +123,23 @@ selected = st.session_state.selected_channel
 
 # Настройка вертикального расстояния между маркерами
 st.sidebar.markdown("### Настройки графика")
-marker_spacing = st.sidebar.slider("Вертикальное расстояние между маркерами", 1, 10, 3, 1)
-
-# Построение графика с уменьшенными отступами и размерами
-plt.rcParams['font.family'] = 'DejaVu Sans'
-fig, ax1 = plt.subplots(figsize=(15, 5))  # Уменьшаем высоту с 6 до 5
-plt.subplots_adjust(bottom=0.15, top=0.95)  # Уменьшаем отступы графика
-ax2 = ax1.twinx()
-
-# Сначала построим графики (все кроме УПП)
-for band in bands:
-    col = (selected, band)
-    if col in df.columns:
-        y = df[col]
-        c = band_colors.get(band)
-        if band != "УПП(<0.5Hz)":
-            ax1.plot(df[('Seconds', '')], y, label=band, color=c, linewidth=3, zorder=5)
-
-# Обработка маркеров
-# Получаем все уникальные маркеры
-markers = df[('Marker', '')].fillna('').astype(str).str.strip().str.replace('.', '').values
-seconds = df[('Seconds', '')].values
-
-# Создаем словарь для хранения последних координат маркеров
-marker_positions = {}
-min_distance = 5  # Минимальное расстояние между метками в секундах
-
-# Сортируем маркеры и их координаты
-for x, m in zip(seconds, markers):
-    if m:
-        # Группируем метки, близкие по времени
-        assigned = False
-        for pos in list(marker_positions.keys()):
-            if abs(x - pos) < min_distance:
-                marker_positions[pos].append((x, m))
-                assigned = True
-                break
-        if not assigned:
-            marker_positions[x] = [(x, m)]
-
-# Настройка осей и легенды с более компактным размещением
-l1, lab1 = ax1.get_legend_handles_labels()
-l2, lab2 = ax2.get_legend_handles_labels()
-ax1.legend(l1 + l2, lab1 + lab2,
-           loc="upper center", bbox_to_anchor=(0.5, -0.1), ncol=6, frameon=False, fontsize=9)
-ax1.yaxis.set_major_locator(ticker.MultipleLocator(5))  # Фиксированные деления на оси Y
-ax1.set_xlim(left=-10)  # фиксируем только нижнюю границу X
-ax2.set_xlim(left=-10)
-ax1.relim()  # пересчитаем по Y
-ax1.autoscale_view()
-ax2.relim()
-ax2.autoscale_view()
-ax1.set_xlabel('Время записи, с', fontsize=10)
-ax1.set_ylabel('Амплитуда ЭЭГ, мкВ', fontsize=10)
-ax2.set_ylabel('Амплитуда УПП, мкВ', fontsize=10)
-plt.title(selected, pad=5)  # Уменьшаем отступ заголовка
-plt.grid(True, zorder=1)  # Сетка снизу всех графиков
-
-# Теперь отрисовываем УПП после того, как графики настроены
-for band in bands:
-    col = (selected, band)
-    if col in df.columns and band == "УПП(<0.5Hz)":
-        y = df[col]
-        c = band_colors.get(band)
-        ax2.plot(df[('Seconds', '')], y, label=band, color=c, linewidth=5, zorder=10)
-
-# Увеличиваем верхний предел оси Y для размещения смещенных маркеров
-y1_lim = ax1.get_ylim()
-ax1.set_ylim(y1_lim[0], y1_lim[1] * 1.2)  # Увеличиваем верхний предел на 20%
-
-# И только после этого отрисуем метки поверх всех графиков
-y_top = ax1.get_ylim()[1] * 0.95  # Отступ для верхних меток
-
-# Отрисовка меток с вертикальным смещением и стрелками
-for group_x, markers in marker_positions.items():
-    # Рисуем вертикальную линию для группы
-    ax1.axvline(x=group_x, color='red', linestyle='--', alpha=0.5, zorder=20)
-
-    # Сортируем маркеры по времени для более стабильного отображения
-    sorted_markers = sorted(markers, key=lambda m: m[0])
-
-    # Отрисовываем метки для этой группы со смещением вниз по Y если их несколько
-    for i, (x, m) in enumerate(sorted_markers):
-        if len(sorted_markers) == 1:
-            # Если одна метка, просто отображаем ее без указателя
-            ax1.text(x, y_top, m,
-                     fontsize=12, ha='center', va='top', color='red', rotation=90,
-                     backgroundcolor='white', alpha=0.9,
-                     zorder=30)  # Увеличиваем zorder для отображения поверх всего
-        else:
-            # Для нескольких меток смещаем вниз и добавляем указатели
-            # Первая метка на самом верху, остальные сдвигаются вниз с отступом
-            y_offset = y_top * (1 - i * marker_spacing * 0.03)  # Смещение вниз пропорционально индексу
-
-            # Отрисовываем текстовую метку с высоким zorder
-            ax1.text(x, y_offset, m,
-                     fontsize=12, ha='center', va='top', color='red', rotation=90,
-                     backgroundcolor='white', alpha=0.9,
-                     zorder=30)  # Высокий zorder для отображения поверх всего
-
-            # Если это не первая метка, добавляем указатель
-            if i > 0:
-                # Добавляем стрелку от смещенной метки к вертикальной линии
-                ax1.annotate('',
-                             xy=(group_x, y_top * 0.9),  # Конец стрелки у вертикальной линии
-                             xytext=(x, y_offset * 0.95),  # Начало стрелки у метки
-                             arrowprops=dict(arrowstyle='->', color='red', alpha=0.7, linewidth=1.5),
-                             zorder=25)  # Высокий zorder для стрелки
-
-plt.tight_layout()
+marker_spacing = st.sidebar.slider("Вертикальное расстояние между маркерами", 1, 10,
+                                   DEFAULT_MARKER_SPACING, 1, key="marker_spacing")
+
+# Построение графика: готовый PNG берётся из кэша по (запись, канал, расстояние между маркерами)
+recording = st.session_state['recording']
+live_tail = st.session_state.get("live_tail")
+with stage("Построение графика", rows=len(recording)):
+    if live_tail is not None and live_tail.recording is recording:
+        # Растущая запись: картинка рисуется один раз на обновление файла, а не на каждый перезапуск
+        png = live_tail.image(("channel", selected, marker_spacing),
+                              lambda: channel_png(recording, selected, marker_spacing, **DISPLAY_OPTIONS))
+    else:
+        png = channel_png(recording, selected, marker_spacing, **DISPLAY_OPTIONS)
 
 # Отображение графика на всю ширину
-st.pyplot(fig)
+with stage("Передача в браузер"):
+    st.image(png, use_container_width=True)
 
 # Явное создание вертикального блока для кнопки
 st.write("")  # Пустая строка для создания вертикального разделения
@@ -280,5 +156,14 @@ if st.button("Сохранить график", key="save_btn"):
     output_path = dest_dir / f"{selected}.png"
 
     # Сохраняем фигуру
-    fig.savefig(output_path)
-    st.success(f"График сохранён: {output_path}")
\ No newline at end of file
+    with stage("Сохранение графика", rows=len(recording)):
+        output_path.write_bytes(channel_png(recording, selected, marker_spacing, **SAVE_OPTIONS))
+    st.success(f"График сохранён: {output_path}")
+# Пакетное сохранение графиков всех каналов в отдельных процессах
+with st.expander("Сохранить все каналы"):
+    export_format, export_dpi = export_settings("export_all")
+    if st.button("Сохранить графики всех каналов", key="save_all_btn"):
+        dest_dir = Path(st.session_state["save_dir"]) / base_name
+        with stage("Сохранение всех каналов", rows=len(recording)):
+            futures = export_channels(recording, available, dest_dir, marker_spacing, export_format, export_dpi)
+            wait_for_export(futures, dest_dir)
@@ -1,14 +1,13 @@
 import streamlit as st
 from sidebar import render_sidebar
-import pandas as pd
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
-import plotly.express as px
+from recording import GROUPS
+from range_figure import build_range_figure
+from table_export import range_text_bytes, write_range_text
+from timing import stage
 import sys
 from pathlib import Path
 import os
 import datetime
-import json
 
 # Добавляем корень проекта в пути импорта
 sys.path.append(str(Path(__file__).parent.parent))
@@ -54,10 +53,10 @@ st.markdown("""
 
 # Заголовок страницы и сайдбар
 st.title("Анализ графика")
-render_sidebar()
+render_sidebar("plotly")
 
 # Проверка наличия данных
-if "file_content" not in st.session_state:
+if "recording" not in st.session_state:
     st.warning("Сначала загрузите файл на главной странице!")
     st.stop()
 
@@ -78,28 +77,60 @@ if "selected_range" not in st.session_state:
     st.session_state.selected_range = {"x_min": None, "x_max": None}
 
 # Подготовка данных
-file_text = st.session_state['file_content']
-lines = [line.strip() for line in file_text.splitlines() if not line.startswith('#')]
-
-groups = ["AVERAGE", "0[P3]15", "1[F3]16", "2[Cz]12", "3[P4]11",
-          "4[F4]10", "5[Fz]32", "6[T3]36", "7[T4]27"]
-bands = ["УПП(<0.5Hz)", "Delta(0.5-4)", "Theta(4-7)", "Alpha(8-14)", "Beta(14-30)", "Gamma(30-95)"]
-
-columns = [('Time', ''), ('Marker', '')]
-for group in groups:
-    for band in bands:
-        columns.append((group, band))
-
-data = []
-for line in lines:
-    parts = line.split()
-    if not line[-1].isnumeric(): parts = parts[:-1]
-    row = [parts[0], parts[1]] + [float(x) for x in parts[2:]]
-    data.append(row)
-df = pd.DataFrame(data, columns=pd.MultiIndex.from_tuples(columns))
-df[('Time', '')] = pd.to_datetime(df[('Time', '')], format='%H:%M:%S')
-start_time = df[('Time', '')].iloc[0]
-df[('Seconds', '')] = (df[('Time', '')] - start_time).dt.total_seconds()
+groups = GROUPS
+recording = st.session_state['recording']
+df = recording.frame
+min_seconds = df[('Seconds', '')].min()
+max_seconds = df[('Seconds', '')].max()
+
+# Границы полей «От:»/«До:» от прошлой записи к новой не подходят. Растущая
+# запись (слежение за файлом) остаётся той же записью: если поле «До:» стояло
+# на её конце, оно сдвигается вслед за новыми строками
+record_id = str(recording.path or recording.digest)
+if st.session_state.get("range_record") != record_id:
+    st.session_state.pop("range_x_min", None)
+    st.session_state.pop("range_x_max", None)
+    st.session_state.range_record = record_id
+elif st.session_state.get("range_x_max", max_seconds) >= st.session_state.get("range_end", max_seconds):
+    st.session_state.range_x_max = float(max_seconds)
+st.session_state.range_end = float(max_seconds)
+for range_key in ("range_x_min", "range_x_max"):
+    if range_key in st.session_state:
+        st.session_state[range_key] = min(max(st.session_state[range_key], float(min_seconds)), float(max_seconds))
+
+# Поля «От:»/«До:» создаются без value=: их значения живут только в
+# session_state, чтобы выделение на графике могло их менять
+st.session_state.setdefault("range_x_min", float(min_seconds))
+st.session_state.setdefault("range_x_max", float(max_seconds))
+
+
+def apply_chart_selection():
+    """Выделение по оси X на графике → поля «От:»/«До:» и selected_range"""
+    chart_state = st.session_state.get("plotly_range_chart")
+    boxes = chart_state.selection.box if chart_state else []
+    if not boxes:
+        return
+    x0, x1 = sorted(boxes[-1]["x"][:2])
+    x0 = min(max(float(x0), float(min_seconds)), float(max_seconds))
+    x1 = min(max(float(x1), float(min_seconds)), float(max_seconds))
+    st.session_state.range_x_min = x0
+    st.session_state.range_x_max = x1
+    st.session_state.selected_range = {"x_min": x0, "x_max": x1}
+
+
+def reset_range():
+    """Возврат ко всей записи"""
+    st.session_state.range_x_min = float(min_seconds)
+    st.session_state.range_x_max = float(max_seconds)
+    st.session_state.selected_range = {"x_min": None, "x_max": None}
+
+
+# Видимый участок графика — диапазон из полей «От:»/«До:». Весь участок
+# прореживается до MAX_POINTS_PER_TRACE точек на линию с сохранением
+# минимумов и максимумов; узкий диапазон отдаётся в полном разрешении.
+view_min = st.session_state.range_x_min
+view_max = st.session_state.range_x_max
+view_start, view_stop = recording.row_range(view_min, view_max)
 
 available_groups = [g for g in groups if g in df.columns.get_level_values(0)]
 
@@ -119,126 +150,31 @@ for i, group in enumerate(available_groups):
 
 selected_group = st.session_state.selected_group
 
+# Режим отрисовки: WebGL быстрее на длинных записях и большом числе маркеров
+render_mode = st.radio("Режим отрисовки", ["SVG", "WebGL"], horizontal=True, key="plotly_render_mode",
+                       help="WebGL рисует линии на видеокарте, а все маркеры — двумя общими "
+                            "слоями вместо отдельной линии и подписи на каждый маркер")
+use_webgl = render_mode == "WebGL"
+
 # Отрисовка графика
-russian_markers = {'В': 'В', 'О': 'О', 'Э': 'Э', 'Д': 'Д', 'К': 'К', 'И': 'И', 'З': 'З'}
-
-# Создаем график с оптимизированными параметрами
-fig = make_subplots(specs=[[{"secondary_y": True}]])
-
-fig.update_layout(
-    width=2000,
-    height=500,  # Уменьшаем высоту для компактности
-    margin=dict(l=40, r=40, t=40, b=40),  # Уменьшаем все отступы
-    legend=dict(x=0.98, y=0.98, font=dict(size=10)),  # Уменьшаем шрифт легенды
-    title=dict(text=f'{selected_group} - Все полосы частот с маркерами', font=dict(size=14)),  # Уменьшаем заголовок
-    xaxis_title='Время записи, секунды',
-    xaxis=dict(title_font=dict(size=12)),  # Уменьшаем шрифт оси X
-    yaxis=dict(title_font=dict(size=12)),  # Уменьшаем шрифт оси Y
-    yaxis2=dict(title_font=dict(size=12))  # Уменьшаем шрифт второй оси Y
-)
-
-for band in bands:
-    if (selected_group, band) in df.columns:
-        y_data = df[(selected_group, band)]
-        line_width = 3
-        secondary = True if band == "УПП(<0.5Hz)" else False
-        fig.add_trace(
-            go.Scatter(
-                x=df[('Seconds', '')],
-                y=y_data,
-                mode='lines',
-                name=f"{band}",  # Укорачиваем название для компактности
-                line=dict(width=line_width)
-            ),
-            secondary_y=secondary
-        )
-
-shapes, annotations = [], []
-df[('Marker', '')] = df[('Marker', '')].str.replace('.', '', regex=False)
-for idx, row in df.iterrows():
-    marker = row[('Marker', '')]
-    if marker:
-        x_pos = row[('Seconds', '')]
-        shapes.append(dict(
-            type='line', x0=x_pos, x1=x_pos,
-            y0=0, y1=1, yref='paper',
-            line=dict(color='red', dash='dash', width=1)
-        ))
-        annotations.append(dict(
-            x=x_pos, y=0.95,
-            xref='x', yref='paper',
-            text=russian_markers.get(marker, '?'),
-            font=dict(color='red', size=12),
-            showarrow=False, textangle=-90
-        ))
-
-fig.update_layout(
-    shapes=shapes,
-    annotations=annotations
-)
-fig.update_yaxes(title_text="Амплитуда ЭЭГ, мкВ", secondary_y=False)
-fig.update_yaxes(title_text="Амплитуда УПП, мкВ", secondary_y=True)
-
-# Добавляем callback для отслеживания увеличения (приближения) графика
-fig.update_layout(
-    updatemenus=[
-        dict(
-            type="buttons",
-            direction="right",
-            buttons=[
-                dict(
-                    label="Сбросить увеличение",
-                    method="relayout",
-                    args=[{"xaxis.autorange": True, "yaxis.autorange": True}]
-                )
-            ],
-            pad={"r": 10, "t": 10},
-            showactive=False,
-            x=0.11,
-            xanchor="left",
-            y=1.1,
-            yanchor="top"
-        )
-    ]
-)
+with stage("Построение графика", rows=view_stop - view_start):
+    fig, points_shown = build_range_figure(recording, selected_group, view_min, view_max, use_webgl)
 
 # Используем use_container_width=True для адаптивности
-plotly_chart = st.plotly_chart(fig, use_container_width=True)
-
-
-# Функция для получения данных из выбранного диапазона
-def get_selected_range_data(df, x_min, x_max, selected_group, bands):
-    if x_min is None or x_max is None:
-        # Если диапазон не выбран, возвращаем все данные
-        return df
-
-    # Фильтруем по выбранному диапазону по оси X (секунды)
-    filtered_df = df[(df[('Seconds', '')] >= x_min) & (df[('Seconds', '')] <= x_max)].copy()
-    return filtered_df
-
-
-# Функция для подготовки данных выбранной группы
-def prepare_selected_data(df, selected_group, bands, x_min=None, x_max=None):
-    # Если указаны диапазоны x_min и x_max, фильтруем данные
-    if x_min is not None and x_max is not None:
-        df = df[(df[('Seconds', '')] >= x_min) & (df[('Seconds', '')] <= x_max)]
-
-    # Создаем новый DataFrame с нужными колонками
-    selected_cols = [('Time', ''), ('Seconds', ''), ('Marker', '')]
-    for band in bands:
-        if (selected_group, band) in df.columns:
-            selected_cols.append((selected_group, band))
-
-    selected_data = df[selected_cols].copy()
-
-    # Преобразуем время в строковый формат для текстового файла
-    selected_data[('Time', '')] = selected_data[('Time', '')].dt.strftime('%H:%M:%S')
-
-    return selected_data
+with stage("Передача в браузер", rows=points_shown):
+    st.plotly_chart(fig, use_container_width=True, key="plotly_range_chart",
+                    on_select=apply_chart_selection, selection_mode="box")
+if points_shown < view_stop - view_start:
+    st.caption(f"Показано {points_shown} из {view_stop - view_start} точек на линию "
+               f"(минимумы и максимумы сохранены). Выделите участок на графике или сузьте "
+               f"диапазон «От:»/«До:», чтобы увидеть его в полном разрешении. Приближение "
+               f"колесиком мыши и кнопками Plotly только увеличивает уже загруженные точки.")
+if view_start > 0 or view_stop < len(recording):
+    st.button("Показать всю запись", key="reset_range_btn", on_click=reset_range)
 
 
 # Функция для сохранения данных в текстовый файл
-def save_data_to_file(data, selected_group, x_min=None, x_max=None):
+def save_data_to_file(selection, selected_group, x_min=None, x_max=None):
     # Создаем имя файла с временной меткой и информацией о диапазоне
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
 
@@ -264,12 +200,9 @@ def save_data_to_file(data, selected_group, x_min=None, x_max=None):
 
     file_path = save_path / filename
 
-    # Преобразуем DataFrame в текстовый формат
-    header = '\t'.join([f"{col[0]}_{col[1]}" if col[1] else col[0] for col in data.columns])
-
+    # Пишем строки участка прямо из массивов записи
     with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(f"# {header}\n")
-        data.to_csv(f, sep='\t', header=False, index=False)
+        write_range_text(f, selection, selected_group)
 
     return str(file_path), filename
 
@@ -281,20 +214,16 @@ col1, col2, col3 = st.columns([2, 2, 3])
 if selected_group:
     with col1:
         st.write("Выберите диапазон времени (секунды):")
-        # Минимальное и максимальное значения для всего графика
-        min_seconds = df[('Seconds', '')].min()
-        max_seconds = df[('Seconds', '')].max()
-
         # Получаем значения из sliders или используем мин/макс весь диапазон
-        x_min = st.number_input("От:", value=float(min_seconds),
+        x_min = st.number_input("От:",
                                 min_value=float(min_seconds),
                                 max_value=float(max_seconds),
-                                step=0.5, format="%.1f")
+                                step=0.5, format="%.1f", key="range_x_min")
 
-        x_max = st.number_input("До:", value=float(max_seconds),
+        x_max = st.number_input("До:",
                                 min_value=float(min_seconds),
                                 max_value=float(max_seconds),
-                                step=0.5, format="%.1f")
+                                step=0.5, format="%.1f", key="range_x_max")
 
         # Сохраняем выбранный диапазон
         st.session_state.selected_range["x_min"] = x_min
@@ -314,18 +243,21 @@ if selected_group:
 
         st.write(f"Выбран диапазон: {range_text}")
 
-        # Подготавливаем данные в соответствии с выбранным диапазоном
-        selected_data = prepare_selected_data(df, selected_group, bands, x_min, x_max)
+        # Участок записи: строки находятся двоичным поиском по секундам, массивы не копируются
+        with stage("Выбор участка") as timing:
+            selection = recording.between(x_min, x_max)
+            timing["rows"] = len(selection)
 
         # Показываем количество точек в выбранном диапазоне
-        st.write(f"Количество точек данных: {len(selected_data)}")
+        st.write(f"Количество точек данных: {len(selection)}")
 
         # Добавляем две кнопки: для сохранения в папку и для скачивания
         col_save, col_download = st.columns(2)
 
         # Кнопка для сохранения данных в папку
         if col_save.button("Сохранить в папку", type="primary"):
-            file_path, filename = save_data_to_file(selected_data, selected_group, x_min, x_max)
+            with stage("Сохранение участка", rows=len(selection)):
+                file_path, filename = save_data_to_file(selection, selected_group, x_min, x_max)
 
             # Отображаем полный путь к файлу
             save_dir = Path(file_path).parent
@@ -334,18 +266,9 @@ if selected_group:
 
         # Кнопка для скачивания данных через браузер
         if col_download.button("Скачать файл", type="secondary"):
-            # Временно сохраняем для скачивания
-            temp_path = Path(st.session_state.data_save_path) / f"temp_{selected_group}_{x_min:.1f}-{x_max:.1f}.txt"
-
-            # Преобразуем DataFrame в текстовый формат для скачивания
-            header = '\t'.join([f"{col[0]}_{col[1]}" if col[1] else col[0] for col in selected_data.columns])
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                f.write(f"# {header}\n")
-                selected_data.to_csv(f, sep='\t', header=False, index=False)
-
-            # Подготовка данных для скачивания через Streamlit
-            with open(temp_path, 'r', encoding='utf-8') as f:
-                file_content = f.read()
+            # Файл собирается в памяти, на диск ничего не пишется
+            with stage("Выгрузка участка", rows=len(selection)):
+                file_content = range_text_bytes(selection, selected_group)
 
             # Создаем имя файла для скачивания
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -365,20 +288,17 @@ if selected_group:
                 mime="text/plain"
             )
 
-            # Удаляем временный файл
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-
 # Добавление инструкции по использованию
 with st.expander("Как использовать приближение графика"):
     st.write("""
-    1. Используйте инструменты Plotly для приближения интересующей области:
-       - Выделите мышью область для увеличения
-       - Используйте колесико мыши для масштабирования
-       - Двойной клик для сброса увеличения
-    2. После приближения интересующей области, введите соответствующие значения времени в поля "От:" и "До:"
+    1. Протяните мышью по графику, чтобы выделить интересующий участок времени:
+       - границы участка сами попадут в поля "От:" и "До:"
+       - график перерисуется по этому участку в полном разрешении
+       - кнопка "Показать всю запись" возвращает весь диапазон
+    2. Границы можно поправить вручную в полях "От:" и "До:". Приближение колесиком
+       мыши и инструментами Plotly только увеличивает картинку: новые точки с сервера
+       не запрашиваются, и на длинном участке видна прореженная линия. Для полного
+       разрешения выделите участок или задайте "От:"/"До:"
     3. Выберите действие:
        - "Сохранить в папку" - сохраняет данные в папку, указанную в боковой панели (Sidebar)
        - "Скачать файл" - скачивает данные через браузер напрямую
@@ -0,0 +1,137 @@
+"""
+График участка записи для страницы «Анализ графика» (Plotly).
+
+Каждая линия прореживается до MAX_POINTS_PER_TRACE точек с сохранением
+минимумов и максимумов; маркеры берутся из таблицы маркеров записи. В режиме
+WebGL все маркеры рисуются двумя общими слоями вместо отдельной фигуры и
+подписи на каждый маркер.
+
+Plotly импортируется при первом построении графика, а не при импорте модуля.
+"""
+
+import numpy as np
+
+from downsample import MAX_POINTS_PER_TRACE, minmax_indices
+from recording import BANDS
+
+RUSSIAN_MARKERS = {'В': 'В', 'О': 'О', 'Э': 'Э', 'Д': 'Д', 'К': 'К', 'И': 'И', 'З': 'З'}
+
+
+def build_range_figure(recording, selected_group, view_min, view_max, use_webgl=False, bands=BANDS):
+    """
+    Строит график группы ``selected_group`` на участке [view_min, view_max]
+    секунд. Возвращает (фигура, наибольшее число точек на линию).
+    """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    df = recording.frame
+    seconds = recording.seconds
+    view_start, view_stop = recording.row_range(view_min, view_max)
+    Scatter = go.Scattergl if use_webgl else go.Scatter
+
+    # Создаем график с оптимизированными параметрами
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+    fig.update_layout(
+        width=2000,
+        height=500,  # Уменьшаем высоту для компактности
+        margin=dict(l=40, r=40, t=40, b=40),  # Уменьшаем все отступы
+        legend=dict(x=0.98, y=0.98, font=dict(size=10)),  # Уменьшаем шрифт легенды
+        title=dict(text=f'{selected_group} - Все полосы частот с маркерами', font=dict(size=14)),  # Уменьшаем заголовок
+        xaxis_title='Время записи, секунды',
+        xaxis=dict(title_font=dict(size=12)),  # Уменьшаем шрифт оси X
+        yaxis=dict(title_font=dict(size=12)),  # Уменьшаем шрифт оси Y
+        yaxis2=dict(title_font=dict(size=12)),  # Уменьшаем шрифт второй оси Y
+        # Протягивание мышью выделяет участок по времени: он уходит на сервер и
+        # становится диапазоном «От:»/«До:», а график перерисовывается по нему
+        dragmode='select',
+        selectdirection='h'
+    )
+    fig.update_xaxes(range=[view_min, view_max])
+
+    points_shown = 0
+    for band in bands:
+        if (selected_group, band) in df.columns:
+            y_column = df[(selected_group, band)].to_numpy()
+            rows = minmax_indices(y_column, view_start, view_stop, MAX_POINTS_PER_TRACE)
+            points_shown = max(points_shown, len(rows))
+            line_width = 3
+            secondary = True if band == "УПП(<0.5Hz)" else False
+            fig.add_trace(
+                Scatter(
+                    x=seconds[rows],
+                    y=y_column[rows],
+                    mode='lines',
+                    name=f"{band}",  # Укорачиваем название для компактности
+                    line=dict(width=line_width)
+                ),
+                secondary_y=secondary
+            )
+
+    # Маркеры видимого участка: секунды и метки без перебора строк таблицы
+    marker_x, marker_values = recording.marker_table(view_start, view_stop)
+    marker_labels = [RUSSIAN_MARKERS.get(m, '?') for m in marker_values]
+
+    shapes, annotations = [], []
+    if use_webgl:
+        # Все маркеры — одна линия с разрывами (NaN) и один слой подписей на
+        # отдельной невидимой оси 0..1, повторяющей координаты yref='paper'
+        fig.update_layout(yaxis3=dict(overlaying='y', range=[0, 1], visible=False, fixedrange=True))
+        fig.add_trace(go.Scattergl(
+            x=np.repeat(marker_x, 3),
+            y=np.tile([0.0, 1.0, np.nan], len(marker_x)),
+            mode='lines', yaxis='y3', hoverinfo='skip', showlegend=False,
+            line=dict(color='red', dash='dash', width=1)
+        ))
+        fig.add_trace(go.Scattergl(
+            x=marker_x, y=np.full(len(marker_x), 0.95),
+            mode='text', text=marker_labels, yaxis='y3', hoverinfo='skip', showlegend=False,
+            textfont=dict(color='red', size=12)
+        ))
+    else:
+        for x_pos, label in zip(marker_x.tolist(), marker_labels):
+            shapes.append(dict(
+                type='line', x0=x_pos, x1=x_pos,
+                y0=0, y1=1, yref='paper',
+                line=dict(color='red', dash='dash', width=1)
+            ))
+            annotations.append(dict(
+                x=x_pos, y=0.95,
+                xref='x', yref='paper',
+                text=label,
+                font=dict(color='red', size=12),
+                showarrow=False, textangle=-90
+            ))
+
+    fig.update_layout(
+        shapes=shapes,
+        annotations=annotations
+    )
+    fig.update_yaxes(title_text="Амплитуда ЭЭГ, мкВ", secondary_y=False)
+    fig.update_yaxes(title_text="Амплитуда УПП, мкВ", secondary_y=True)
+
+    # Добавляем callback для отслеживания увеличения (приближения) графика
+    fig.update_layout(
+        updatemenus=[
+            dict(
+                type="buttons",
+                direction="right",
+                buttons=[
+                    dict(
+                        label="Сбросить увеличение",
+                        method="relayout",
+                        args=[{"xaxis.autorange": True, "yaxis.autorange": True}]
+                    )
+                ],
+                pad={"r": 10, "t": 10},
+                showactive=False,
+                x=0.11,
+                xanchor="left",
+                y=1.1,
+                yanchor="top"
+            )
+        ]
+    )
+
+    return fig, points_shown
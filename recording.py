@@ -0,0 +1,464 @@
+"""
+Разбор текстовых записей OEEG.
+
+Строка записи: время ``HH:MM:SS``, столбец маркера и 54 значения
+(9 групп × 6 частотных диапазонов), разделённые пробельными символами.
+Строки, начинающиеся с ``#``, считаются комментариями.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+GROUPS = ["AVERAGE", "0[P3]15", "1[F3]16", "2[Cz]12", "3[P4]11",
+          "4[F4]10", "5[Fz]32", "6[T3]36", "7[T4]27"]
+BANDS = ["УПП(<0.5Hz)", "Delta(0.5-4)", "Theta(4-7)",
+         "Alpha(8-14)", "Beta(14-30)", "Gamma(30-95)"]
+
+# Время, маркер и по значению на каждую пару (группа, диапазон)
+N_COLUMNS = 2 + len(GROUPS) * len(BANDS)
+
+# Значения каналов храним в float32: точности прибора хватает, памяти вдвое меньше
+VALUE_DTYPE = np.float32
+
+# Папка, куда сбрасываются загруженные файлы, чтобы не держать их текст в памяти
+SPOOL_DIR = Path(tempfile.gettempdir()) / "oeeg_plot"
+# Сброшенные файлы старше этого (например, после ошибки разбора) удаляются при следующей загрузке
+SPOOL_MAX_AGE_HOURS = 24
+
+# Бинарная копия разобранной записи внутри папки записи (output_dir)
+SIDECAR_DIR = "_recording"
+# 2 — секунды после полуночи продолжают расти (раньше сбрасывались в ноль);
+# 3 — подводка часов назад больше не считается переходом через полночь
+SIDECAR_VERSION = 3
+
+# Через сколько часов без открытия копия прежнего содержимого файла удаляется
+SIDECAR_STALE_HOURS = 24
+
+# Шаг назад больше полусуток — переход через полночь, а не подводка часов прибора
+MIDNIGHT_JUMP = pd.Timedelta(hours=12)
+
+# Строки «ЧЧ:ММ:СС» для каждой секунды суток; строятся при первом обращении
+_CLOCK_STRINGS = None
+
+
+def _as_buffer(source):
+    """Приводит источник (текст, байты, Path или файл) к виду, понятному read_csv"""
+    if isinstance(source, str):
+        return io.StringIO(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
+
+def read_table(source):
+    """
+    Читает сырую таблицу записи: столбцы 0..55 (время, маркер, 54 значения).
+
+    Правило столбца маркера: маркер — всегда второй токен строки. Всё, что стоит
+    после 56-го токена (хвостовая пометка прибора), отбрасывается, поэтому
+    отрицательные и целые значения в последнем столбце данных не теряются.
+    """
+    # Лишний 57-й столбец принимает хвостовую пометку; usecols здесь не подходит —
+    # C-парсер падает на нём, если ни в одной строке пометки нет
+    table = pd.read_csv(
+        _as_buffer(source),
+        sep=r"\s+",
+        header=None,
+        names=range(N_COLUMNS + 1),
+        comment="#",
+        skip_blank_lines=True,
+        encoding="utf-8",
+        dtype={0: str, 1: str, N_COLUMNS: str, **{i: VALUE_DTYPE for i in range(2, N_COLUMNS)}},
+        engine="c",
+    )
+    return table.drop(columns=N_COLUMNS)
+
+
+def clock_to_datetime(clock):
+    """
+    Переводит строки ``HH:MM:SS`` в datetime (дата 1900-01-01, как у
+    ``pd.to_datetime(..., format='%H:%M:%S')``), разбирая цифры векторно.
+    """
+    chars = np.asarray(clock, dtype="U8")
+    codes = chars.view(np.uint32).reshape(-1, 8).astype(np.int64) - ord("0")
+    digits = codes[:, [0, 1, 3, 4, 6, 7]]
+    well_formed = (
+        (np.char.str_len(chars) == 8).all()
+        and (codes[:, [2, 5]] == ord(":") - ord("0")).all()
+        and ((digits >= 0) & (digits <= 9)).all()
+    )
+    if not well_formed:
+        # Нестандартная запись времени — отдаём разбор pandas
+        return pd.to_datetime(pd.Series(clock), format="%H:%M:%S")
+
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    minutes = digits[:, 2] * 10 + digits[:, 3]
+    secs = digits[:, 4] * 10 + digits[:, 5]
+    if (hours > 23).any() or (minutes > 59).any() or (secs > 59).any():
+        return pd.to_datetime(pd.Series(clock), format="%H:%M:%S")
+
+    total = hours * 3600 + minutes * 60 + secs
+    return pd.Series(pd.Timestamp("1900-01-01") + pd.to_timedelta(total, unit="s"))
+
+
+def unwrap_midnight(time, previous=None, days=0):
+    """
+    Запись, идущая через полночь: в файле время снова начинается с 00:00:00.
+    Каждый такой переход добавляет сутки ко всем следующим строкам, чтобы
+    время и секунды от начала записи не убывали — на этом держится поиск
+    строк по времени двоичным поиском.
+
+    Переходом считается только шаг назад больше чем на ``MIDNIGHT_JUMP``
+    (23:59:59 → 00:00:00). Небольшой шаг назад — подводка часов прибора —
+    остаётся как есть и на следующие строки не влияет.
+
+    Для записи, читаемой кусками: ``previous`` — время (как в файле) последней
+    строки предыдущего куска, ``days`` — сколько суток уже прибавлено к ней.
+    """
+    steps = time.diff()
+    if previous is not None and len(time):
+        steps.iloc[0] = time.iloc[0] - previous
+    days = (steps < -MIDNIGHT_JUMP).cumsum() + days
+    if not days.iloc[-1:].any():
+        return time
+    return time + pd.to_timedelta(days, unit="D")
+
+
+def clock_strings(time):
+    """Столбец времени как строки ``HH:MM:SS`` — выборкой из готовой таблицы на сутки, без strftime"""
+    global _CLOCK_STRINGS
+    if _CLOCK_STRINGS is None:
+        _CLOCK_STRINGS = np.array([f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(86400)],
+                                  dtype=object)
+    time = np.asarray(time, dtype="datetime64[s]")
+    second_of_day = (time - time.astype("datetime64[D]")).astype(np.int64)
+    return _CLOCK_STRINGS[second_of_day]
+
+
+def normalize_markers(markers):
+    """Убирает точки-заполнители из столбца маркера: '.' → '', 'В.' → 'В'"""
+    return pd.Series(markers, dtype=object).fillna("").astype(str) \
+        .str.strip().str.replace(".", "", regex=False).to_numpy(dtype=object)
+
+
+def content_digest(data):
+    """Хэш содержимого файла — ключ разобранной записи"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_digest(path):
+    """Хэш содержимого файла на диске, читаемого блоками"""
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def evict_spool(spool_dir=SPOOL_DIR, max_age_hours=SPOOL_MAX_AGE_HOURS):
+    """Удаляет сброшенные на диск файлы, которые не менялись дольше ``max_age_hours``"""
+    stale_before = time.time() - max_age_hours * 3600
+    try:
+        files = list(Path(spool_dir).iterdir())
+    except OSError:
+        return
+    for f in files:
+        try:
+            if f.stat().st_mtime < stale_before:
+                f.unlink()
+        except OSError:
+            pass
+
+
+def spool_upload(fileobj, spool_dir=SPOOL_DIR):
+    """
+    Копирует загруженный файл на диск, считая хэш по ходу копирования.
+
+    У каждой загрузки свой файл (имя начинается с хэша содержимого), даже
+    если те же байты одновременно загружает другая сессия: файл удаляет
+    вызывающий код, когда он больше не нужен, и чужую загрузку это не
+    задевает. Забытые файлы старше ``SPOOL_MAX_AGE_HOURS`` удаляются здесь.
+    Возвращает (путь, хэш).
+    """
+    spool_dir = Path(spool_dir)
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    evict_spool(spool_dir)
+
+    hasher = hashlib.blake2b(digest_size=16)
+    fileobj.seek(0)
+    with tempfile.NamedTemporaryFile(dir=spool_dir, suffix=".part", delete=False) as tmp:
+        for chunk in iter(lambda: fileobj.read(1 << 20), b""):
+            hasher.update(chunk)
+            tmp.write(chunk)
+    digest = hasher.hexdigest()
+
+    path = spool_dir / f"{digest}.{Path(tmp.name).stem}.txt"
+    shutil.move(tmp.name, path)
+    return path, digest
+
+
+class Recording:
+    """
+    Разобранная запись в колоночном виде.
+
+    ``values`` — матрица (строки × 54) в порядке ``(группа, диапазон)`` из
+    GROUPS × BANDS; ``start`` — время первой строки, столбец Time
+    восстанавливается из него и ``seconds``. DataFrame для страниц строится
+    один раз по требованию.
+    """
+
+    def __init__(self, start, seconds, markers, values, name="", digest="", path=None, time=None,
+                 marker_rows=None):
+        self.start = np.datetime64(start, "ns")
+        self.seconds = seconds
+        self.markers = markers
+        self.values = values
+        self.name = name
+        self.digest = digest
+        self.path = path
+        self._time = time
+        self._clock = None
+        self._marker_rows = marker_rows
+        self.sidecar_dir = None
+        self._frame = None
+        self._nbytes = None
+
+    def __len__(self):
+        return len(self.seconds)
+
+    def row_range(self, x_min=None, x_max=None):
+        """
+        Границы строк [start, stop) со временем в отрезке [x_min, x_max] секунд.
+
+        Секунды не убывают (см. :func:`unwrap_midnight`), поэтому хватает двух
+        двоичных поисков — O(log n) вместо маски по всей записи. Если часы
+        прибора подводились назад, граница у такого места может сдвинуться на
+        несколько строк.
+        """
+        start = 0 if x_min is None else int(np.searchsorted(self.seconds, x_min, side="left"))
+        stop = len(self) if x_max is None else int(np.searchsorted(self.seconds, x_max, side="right"))
+        return start, max(start, stop)
+
+    def view(self, start=0, stop=None):
+        """
+        Строки [start, stop) как отдельная запись без копирования: массивы
+        нового объекта — срезы (views) массивов этой записи.
+        """
+        stop = len(self) if stop is None else stop
+        rows = slice(start, stop)
+        part = Recording(self.start, self.seconds[rows], self.markers[rows], self.values[rows],
+                         name=self.name, digest=self.digest, path=self.path, time=self.time[rows])
+        part._clock = None if self._clock is None else self._clock[rows]
+        return part
+
+    def between(self, x_min=None, x_max=None):
+        """Участок записи со временем в отрезке [x_min, x_max] секунд (без копирования)"""
+        return self.view(*self.row_range(x_min, x_max))
+
+    @property
+    def marker_rows(self):
+        """Номера строк с маркерами; считаются один раз на запись"""
+        if self._marker_rows is None:
+            self._marker_rows = np.flatnonzero(self.markers != "")
+        return self._marker_rows
+
+    def marker_table(self, start=0, stop=None):
+        """Секунды и метки маркеров в строках [start, stop)"""
+        stop = len(self) if stop is None else stop
+        rows = self.marker_rows
+        rows = rows[np.searchsorted(rows, start):np.searchsorted(rows, stop)]
+        return np.asarray(self.seconds)[rows], self.markers[rows]
+
+    @property
+    def time(self):
+        """Столбец Time (datetime64) — начало записи плюс секунды"""
+        if self._time is None:
+            offsets = np.round(np.asarray(self.seconds) * 1e9).astype("timedelta64[ns]")
+            self._time = self.start + offsets
+        return self._time
+
+    @property
+    def clock(self):
+        """Столбец Time строками ``HH:MM:SS`` для текстовых выгрузок; считается один раз на запись"""
+        if self._clock is None:
+            self._clock = clock_strings(self.time)
+        return self._clock
+
+    @property
+    def nbytes(self):
+        """Объём памяти, занятый записью (DataFrame ссылается на те же массивы)"""
+        if self._nbytes is None:
+            markers = pd.Series(self.markers, dtype=object).memory_usage(deep=True, index=False)
+            self._nbytes = self.time.nbytes + self.seconds.nbytes + self.values.nbytes + int(markers)
+        return self._nbytes
+
+    def to_frame(self, groups=GROUPS, bands=BANDS):
+        """DataFrame с колонками ('Time', ''), ('Seconds', ''), ('Marker', '') и (группа, диапазон)"""
+        columns = [(g, b) for g in GROUPS for b in BANDS]
+        selected = [columns.index((g, b)) for g in groups for b in bands]
+        # Полный набор колонок не копируем: DataFrame смотрит прямо в self.values
+        block = self.values if selected == list(range(len(columns))) else self.values[:, selected]
+        values = pd.DataFrame(block, copy=False,
+                              columns=pd.MultiIndex.from_tuples([columns[i] for i in selected]))
+
+        head = pd.DataFrame({
+            ("Time", ""): self.time,
+            ("Seconds", ""): self.seconds,
+            ("Marker", ""): self.markers,
+        })
+        head.columns = pd.MultiIndex.from_tuples(head.columns)
+        return pd.concat([head, values], axis=1, copy=False)
+
+    @property
+    def frame(self):
+        """Полный DataFrame записи; строится при первом обращении и переиспользуется"""
+        if self._frame is None:
+            self._frame = self.to_frame()
+        return self._frame
+
+
+def read_recording(source, name="", digest="", path=None):
+    """Разбирает запись OEEG в объект Recording"""
+    table = read_table(source)
+
+    # Время → секунды от начала записи
+    time = unwrap_midnight(clock_to_datetime(table[0].to_numpy()))
+    seconds = (time - time.iloc[0]).dt.total_seconds()
+
+    return Recording(
+        start=time.iloc[0],
+        time=time.to_numpy(),
+        seconds=seconds.to_numpy(),
+        markers=normalize_markers(table[1]),
+        values=table.iloc[:, 2:].to_numpy(dtype=VALUE_DTYPE),
+        name=name,
+        digest=digest,
+        path=path,
+    )
+
+
+def _sidecar_target(directory, digest):
+    return Path(directory) / SIDECAR_DIR / digest
+
+
+def save_sidecar(recording, directory):
+    """
+    Сохраняет разобранную запись рядом с результатами: ``directory/_recording/<хэш>``.
+
+    Секунды (float64), матрица значений (float32) и таблица маркеров (номер
+    строки, метка) лежат в .npy, описание — в meta.json. Копия пишется во
+    временную папку и переименовывается целиком, а папка называется по хэшу
+    содержимого: готовые файлы никогда не перезаписываются, поэтому их можно
+    держать отображёнными в память в других сессиях и процессах отрисовки.
+    Копии прежнего содержимого файла с тем же именем, которые не открывались
+    дольше ``SIDECAR_STALE_HOURS``, удаляются.
+    """
+    target = _sidecar_target(directory, recording.digest)
+    if not (target / "meta.json").exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=target.parent, prefix=f"{recording.digest}.", suffix=".tmp"))
+        try:
+            marker_rows = recording.marker_rows
+            marker_labels = recording.markers[marker_rows].astype(str)
+            np.save(tmp / "seconds.npy", np.asarray(recording.seconds, dtype=np.float64))
+            np.save(tmp / "values.npy", np.ascontiguousarray(recording.values, dtype=VALUE_DTYPE))
+            np.save(tmp / "marker_rows.npy", marker_rows.astype(np.int64))
+            np.save(tmp / "marker_labels.npy", marker_labels)
+
+            meta = {
+                "version": SIDECAR_VERSION,
+                "digest": recording.digest,
+                "name": recording.name,
+                "rows": len(recording),
+                "start": str(recording.start),
+                "groups": GROUPS,
+                "bands": BANDS,
+            }
+            with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp, target)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            # Ту же копию успела записать другая сессия — она ничем не хуже
+            if not (target / "meta.json").exists():
+                raise
+
+    stale_before = time.time() - SIDECAR_STALE_HOURS * 3600
+    for other in target.parent.iterdir():
+        if other == target or other.name.endswith(".tmp"):
+            continue
+        # Занятые файлы (Windows) остаются до следующего раза
+        try:
+            if not other.is_dir():
+                other.unlink()  # файлы копии прежнего формата, без папки по хэшу
+            elif (other / "meta.json").stat().st_mtime < stale_before:
+                shutil.rmtree(other)
+        except OSError:
+            pass
+
+    recording.sidecar_dir = Path(directory)
+    return target
+
+
+def open_sidecar(directory, digest, path=None):
+    """
+    Открывает бинарную копию записи с отображением файлов в память.
+
+    Возвращает None, если копии нет, она другой версии или построена по
+    другому содержимому файла.
+    """
+    target = _sidecar_target(directory, digest)
+    try:
+        with open(target / "meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        # Время открытия — копии, которыми давно не пользовались, удаляет save_sidecar
+        os.utime(target / "meta.json")
+        if meta.get("version") != SIDECAR_VERSION or meta.get("digest") != digest:
+            return None
+
+        seconds = np.load(target / "seconds.npy", mmap_mode="r")
+        values = np.load(target / "values.npy", mmap_mode="r")
+        marker_rows = np.load(target / "marker_rows.npy")
+        marker_labels = np.load(target / "marker_labels.npy")
+    except (OSError, ValueError):
+        return None
+    if len(seconds) != meta["rows"] or values.shape != (meta["rows"], N_COLUMNS - 2):
+        return None
+
+    markers = np.full(len(seconds), "", dtype=object)
+    markers[marker_rows] = marker_labels.astype(object)
+    recording = Recording(
+        start=np.datetime64(meta["start"], "ns"),
+        seconds=seconds,
+        markers=markers,
+        values=values,
+        name=meta["name"],
+        digest=digest,
+        path=path,
+        marker_rows=marker_rows,
+    )
+    recording.sidecar_dir = Path(directory)
+    return recording
+
+
+def parse_recording(source, groups=GROUPS, bands=BANDS):
+    """
+    Разбирает запись OEEG в DataFrame с MultiIndex-колонками:
+    ('Time', ''), ('Seconds', ''), ('Marker', '') и (группа, диапазон).
+    """
+    return read_recording(source).to_frame(groups, bands)
+
+
+def load_recording(path):
+    """Разбирает запись, сохранённую на диске"""
+    path = Path(path)
+    return read_recording(path, name=path.name, digest=file_digest(path), path=path)
@@ -0,0 +1,170 @@
+"""
+Кэш результатов расчёта на диске.
+
+Ключ — хэш содержимого записи, этап расчёта и его параметры, поэтому для
+поиска не нужно хэшировать сами таблицы. Значения хранятся компактно:
+массивы numpy (.npz) или готовые байты (PNG). Кэш переживает перезапуск
+сервера; когда он становится больше ``CACHE_LIMIT_MB``, удаляются файлы,
+которые дольше всех не читались, а файлы, не читавшиеся дольше
+``CACHE_MAX_AGE_DAYS``, удаляются в любом случае.
+
+В ключ входит ``CACHE_VERSION``: после изменения расчёта или оформления
+графиков версия повышается, и старые результаты больше не находятся.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from mean_sem import block_stats, mean_sem_tables, sweep_stats, value_matrix
+
+CACHE_DIR = Path(os.environ.get("OEEG_CACHE_DIR")
+                 or Path(os.environ.get("LOCALAPPDATA") or Path.home() / ".cache") / "oeeg_plot" / "results")
+CACHE_LIMIT_MB = int(os.environ.get("OEEG_CACHE_MB", "512"))
+CACHE_MAX_AGE_DAYS = float(os.environ.get("OEEG_CACHE_DAYS", "30"))
+
+# Версия расчётов и графиков в кэше; повышается при любом изменении результата
+CACHE_VERSION = 1
+
+
+def cache_path(digest, stage, params, suffix):
+    """Файл результата этапа ``stage`` с параметрами ``params`` для записи ``digest``"""
+    params_hash = hashlib.blake2b(repr(params).encode("utf-8"), digest_size=8).hexdigest()
+    return CACHE_DIR / f"{digest}_{stage}_v{CACHE_VERSION}_{params_hash}{suffix}"
+
+
+def _touch(path):
+    # Время последнего чтения — по нему выбираются файлы на удаление
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _write_atomic(path, write):
+    """Пишет во временный файл и переименовывает: недописанный результат никогда не читается"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    evict()
+
+
+def evict(limit_mb=CACHE_LIMIT_MB, max_age_days=CACHE_MAX_AGE_DAYS):
+    """
+    Удаляет файлы, не читавшиеся дольше ``max_age_days``, и самые давно
+    использованные, пока кэш больше ``limit_mb``
+    """
+    try:
+        files = [(f.stat(), f) for f in CACHE_DIR.iterdir() if f.suffix != ".tmp"]
+    except OSError:
+        return
+    total = sum(stat.st_size for stat, _ in files)
+    limit = limit_mb * 2 ** 20
+    oldest_allowed = time.time() - max_age_days * 86400
+    for stat, f in sorted(files, key=lambda item: item[0].st_mtime):
+        if total <= limit and stat.st_mtime >= oldest_allowed:
+            break
+        try:
+            f.unlink(missing_ok=True)
+        except OSError:
+            continue
+        total -= stat.st_size
+
+
+def load_arrays(digest, stage, params):
+    """Массивы из кэша (dict) или None"""
+    path = cache_path(digest, stage, params, ".npz")
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+    except (OSError, ValueError):
+        return None
+    _touch(path)
+    return arrays
+
+
+def store_arrays(digest, stage, params, **arrays):
+    try:
+        _write_atomic(cache_path(digest, stage, params, ".npz"), lambda f: np.savez(f, **arrays))
+    except OSError:
+        # Без кэша всё работает, только медленнее
+        pass
+
+
+def load_bytes(digest, stage, params):
+    """Байты из кэша или None"""
+    path = cache_path(digest, stage, params, ".bin")
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    _touch(path)
+    return data
+
+
+def store_bytes(digest, stage, params, data):
+    try:
+        _write_atomic(cache_path(digest, stage, params, ".bin"), lambda f: f.write(data))
+    except OSError:
+        pass
+
+
+def _stats_params(groups, bands, window_size):
+    return tuple(groups), tuple(bands), int(window_size)
+
+
+def cached_mean_sem(recording, groups, bands, window_size):
+    """
+    :func:`mean_sem.block_mean_sem` для записи с кэшем поблочных MEAN/SEM
+    на диске. Таблицы собираются заново из сохранённых массивов.
+    """
+    df = recording.frame
+    params = _stats_params(groups, bands, window_size)
+    cached = load_arrays(recording.digest, "mean_sem", params) if recording.digest else None
+    if cached is None:
+        last_rows, means, sems = block_stats(value_matrix(df, groups, bands), window_size)
+        if recording.digest:
+            store_arrays(recording.digest, "mean_sem", params, last_rows=last_rows, means=means, sems=sems)
+    else:
+        last_rows, means, sems = cached["last_rows"], cached["means"], cached["sems"]
+    return mean_sem_tables(df, groups, bands, (last_rows, means, sems))
+
+
+def cached_sweep_mean_sem(recording, groups, bands, window_sizes):
+    """
+    :func:`mean_sem.sweep_mean_sem` с кэшем: из сохранённых окон ничего не
+    пересчитывается, недостающие считаются вместе за один проход.
+    """
+    df = recording.frame
+    stats, missing = {}, []
+    for window_size in window_sizes:
+        cached = None
+        if recording.digest:
+            cached = load_arrays(recording.digest, "sweep", _stats_params(groups, bands, window_size))
+        if cached is None:
+            missing.append(window_size)
+        else:
+            stats[window_size] = (cached["last_rows"], cached["means"], cached["sems"])
+
+    if missing:
+        computed = sweep_stats(value_matrix(df, groups, bands), missing)
+        for window_size, (last_rows, means, sems) in computed.items():
+            stats[window_size] = (last_rows, means, sems)
+            if recording.digest:
+                store_arrays(recording.digest, "sweep", _stats_params(groups, bands, window_size),
+                             last_rows=last_rows, means=means, sems=sems)
+
+    return {
+        window_size: mean_sem_tables(df, groups, bands, stats[window_size])
+        for window_size in window_sizes
+    }
@@ -1,8 +1,171 @@
+import os
+from concurrent.futures import as_completed
+
 import streamlit as st
 from pathlib import Path
 
+from channel_plot import (DEFAULT_MARKER_SPACING, DISPLAY_OPTIONS, EXPORT_DPI, EXPORT_FORMATS,
+                          prerender_channels, prerender_progress)
+from recording import GROUPS, open_sidecar, read_recording, save_sidecar, spool_upload
+from timing import begin_run, stage
+
+# Потолок памяти под разобранную запись одной сессии, МБ
+SESSION_MEMORY_LIMIT_MB = int(os.environ.get("OEEG_SESSION_MEMORY_MB", "1024"))
+
+# Во сколько раз разобранная запись больше текста файла: float32 на значение
+# против ~6 символов, плюс время и маркеры — примерно столько же, сколько текст
+UPLOAD_EXPANSION = 1.0
+
+
+def _reject_upload(name, size_mb):
+    st.session_state.pop("recording", None)
+    st.session_state.pop("uploaded_name", None)
+    st.error(f"Запись «{name}» занимает {size_mb:.0f} МБ — больше лимита "
+             f"сессии {SESSION_MEMORY_LIMIT_MB} МБ (переменная OEEG_SESSION_MEMORY_MB).")
+
+
+def store_upload(uploaded_file):
+    """
+    Разбирает загруженный файл один раз и кладёт запись в session_state.
+
+    Текст файла в сессии не хранится: файл сбрасывается на диск, а в
+    session_state остаются массивы float32. Повторные перезапуски страницы
+    с тем же файлом ничего не пересчитывают: запись ищется по file_id
+    загрузки, затем по хэшу содержимого, затем в бинарной копии в папке
+    записи — и только потом файл разбирается заново. Когда запись читается
+    не из сброшенного на диск файла этой загрузки, файл удаляется. Если включена
+    заблаговременная отрисовка, она запускается здесь же.
+    """
+    if st.session_state.get("upload_id") == uploaded_file.file_id:
+        return st.session_state.get("recording")
+
+    # Оценка по размеру файла — до того, как разбор займёт память
+    estimate_mb = uploaded_file.size * UPLOAD_EXPANSION / 2 ** 20
+    if estimate_mb > SESSION_MEMORY_LIMIT_MB:
+        _reject_upload(uploaded_file.name, estimate_mb)
+        return None
+
+    path, digest = spool_upload(uploaded_file)
+
+    recording = st.session_state.get("recording")
+    if recording is None or recording.digest != digest:
+        output_dir = Path(Path(uploaded_file.name).stem)
+        recording = open_sidecar(output_dir, digest)
+        if recording is None:
+            with stage("Разбор файла") as timing:
+                recording = read_recording(path, name=uploaded_file.name, digest=digest, path=path)
+                timing["rows"] = len(recording)
+            try:
+                save_sidecar(recording, output_dir)
+                recording.path = None
+            except OSError:
+                # Без бинарной копии всё работает, просто следующий раз файл разберётся заново
+                pass
+    # Запись разобрана — только теперь загрузка считается обработанной
+    st.session_state["upload_id"] = uploaded_file.file_id
+
+    size_mb = recording.nbytes / 2 ** 20
+    rejected = size_mb > SESSION_MEMORY_LIMIT_MB
+    if rejected or recording.path != path:
+        # Запись читается из бинарной копии (или из файла прошлой загрузки), и файл
+        # этой загрузки больше не нужен; он принадлежит только ей, другие сессии это не задевает
+        try:
+            path.unlink(missing_ok=True)
+        except OSError:
+            pass
+    if rejected:
+        _reject_upload(uploaded_file.name, size_mb)
+        return None
+
+    st.session_state["recording"] = recording
+    st.session_state["uploaded_name"] = uploaded_file.name
+    if st.session_state.get("prerender_channels"):
+        # Графики каналов начинают рисоваться сразу после разбора, на какой бы странице ни загрузили файл
+        marker_spacing = st.session_state.get("marker_spacing", DEFAULT_MARKER_SPACING)
+        prerender_channels(recording, GROUPS, marker_spacing, **DISPLAY_OPTIONS)
+    return recording
+
+
+@st.fragment(run_every=1)
+def prerender_status(recording, marker_spacing):
+    """
+    Прогресс фоновой отрисовки графиков каналов; обновляется раз в секунду,
+    пока отрисовка идёт. Когда она закончена, перезапускает страницу — без
+    идущей отрисовки фрагмент больше не показывается и не обновляется.
+    """
+    progress = prerender_progress(recording, marker_spacing, **DISPLAY_OPTIONS)
+    if progress is None or progress[0] + progress[2] >= progress[1]:
+        st.rerun(scope="app")
+    done, total, failed = progress
+    st.progress(done / total, text=f"Графики каналов: {done} из {total}")
+
+
+def prerender_summary(recording, marker_spacing):
+    """Фоновая отрисовка: прогресс, пока она идёт, затем итог"""
+    progress = prerender_progress(recording, marker_spacing, **DISPLAY_OPTIONS)
+    if progress is None:
+        return
+    done, total, failed = progress
+    if done + failed < total:
+        prerender_status(recording, marker_spacing)
+    elif failed:
+        st.caption(f"Графики каналов готовы: {done}, с ошибкой: {failed}")
+    else:
+        st.caption("Графики всех каналов готовы")
 
-def render_sidebar():
+
+def start_live(path):
+    """Начинает слежение за файлом ``path`` и кладёт уже записанную часть в session_state"""
+    from live import RecordingTail
+
+    tail = st.session_state.get("live_tail")
+    if tail is None or tail.path != Path(path):
+        tail = RecordingTail(path)
+        st.session_state["live_tail"] = tail
+    tail.poll()
+    if tail.recording is not None:
+        st.session_state["recording"] = tail.recording
+        st.session_state["uploaded_name"] = tail.path.name
+    return tail
+
+
+@st.fragment(run_every=2)
+def live_status(tail):
+    """Раз в две секунды дочитывает файл; если появились строки — перезапускает страницу"""
+    new_rows = tail.poll()
+    if new_rows and tail.recording is not None:
+        st.session_state["recording"] = tail.recording
+        st.session_state["uploaded_name"] = tail.path.name
+        st.rerun(scope="app")
+    st.caption(f"Строк в записи: {tail.rows}")
+
+
+def export_settings(key):
+    """Поля «формат» и «DPI» для пакетного сохранения; возвращает (формат, dpi)"""
+    col_fmt, col_dpi = st.columns(2)
+    fmt = col_fmt.selectbox("Формат", EXPORT_FORMATS, key=f"{key}_format")
+    dpi = col_dpi.number_input("DPI", min_value=50, max_value=600, value=EXPORT_DPI, step=50,
+                               key=f"{key}_dpi")
+    return fmt, int(dpi)
+
+
+def wait_for_export(futures, dest_dir):
+    """Ждёт задачи пакетного сохранения, показывая прогресс, и сообщает итог"""
+    total = len(futures)
+    progress = st.progress(0.0, text=f"Сохранено 0 из {total}")
+    errors = []
+    for done, future in enumerate(as_completed(futures), start=1):
+        if future.exception() is not None:
+            errors.append(future.exception())
+        progress.progress(done / total, text=f"Сохранено {done} из {total}")
+    if errors:
+        st.error(f"Не удалось сохранить {len(errors)} из {total} графиков: {errors[0]}")
+    else:
+        st.success(f"Сохранено графиков: {total} в {dest_dir}")
+
+
+def render_sidebar(page=""):
+    """Боковая панель страницы ``page`` (имя страницы попадает в журнал замеров)"""
     st.markdown(
         """
         <style>
@@ -29,6 +192,26 @@ def render_sidebar():
             help="Укажите абсолютный или относительный путь"
         )
 
+        st.checkbox(
+            "Заранее строить графики всех каналов",
+            key="prerender_channels",
+            help="После загрузки файла графики всех девяти каналов строятся в фоновых процессах, "
+                 "и переключение каналов на странице «Построение графика» происходит мгновенно"
+        )
+
+        # Замеры этапов: таблица заполняется по ходу выполнения страницы
+        timing_enabled = st.checkbox(
+            "Замерять этапы",
+            key="timing_enabled",
+            help="Время и пик памяти разбора, расчёта, построения графиков, передачи в браузер "
+                 "и выгрузки. Если задана переменная OEEG_TIMING_LOG, замеры дописываются в этот файл"
+        )
+        if timing_enabled:
+            with st.expander("Замеры времени"):
+                begin_run(page, st.empty())
+        else:
+            begin_run(page)
+
         # Загрузка файла
         st.title("Загрузка файла")
         uploaded_file = st.file_uploader(
@@ -36,5 +219,28 @@ def render_sidebar():
             type=["txt"]
         )
         if uploaded_file is not None:
-            st.session_state["file_content"] = uploaded_file.getvalue().decode("utf-8")
-            st.session_state["uploaded_name"] = uploaded_file.name
\ No newline at end of file
+            store_upload(uploaded_file)
+
+        # Запись, которую прибор ещё пишет: файл дочитывается по мере роста
+        live_path = st.text_input("Следить за файлом (запись идёт сейчас)", key="live_path",
+                                  help="Путь к текстовому файлу, который прибор дописывает во время сеанса. "
+                                       "Новые строки подхватываются каждые две секунды.")
+        live = st.checkbox("Следить за файлом", key="live_watch", disabled=not live_path)
+        if live and live_path:
+            if Path(live_path).is_file():
+                live_status(start_live(live_path))
+            else:
+                st.error(f"Файл не найден: {live_path}")
+        else:
+            st.session_state.pop("live_tail", None)
+
+        recording = st.session_state.get("recording")
+        if recording is not None:
+            st.caption(f"Память записи: {recording.nbytes / 2 ** 20:.1f} МБ "
+                       f"из {SESSION_MEMORY_LIMIT_MB} МБ")
+
+            # Для растущей записи заранее не рисуем: картинки устаревают с каждой новой строкой
+            if st.session_state.get("prerender_channels") and "live_tail" not in st.session_state:
+                marker_spacing = st.session_state.get("marker_spacing", DEFAULT_MARKER_SPACING)
+                prerender_channels(recording, GROUPS, marker_spacing, **DISPLAY_OPTIONS)
+                prerender_summary(recording, marker_spacing)
\ No newline at end of file
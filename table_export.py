@@ -0,0 +1,165 @@
+"""
+Выгрузка таблиц MEAN/SEM в Excel, Parquet и CSV и участков записи в текст.
+
+Excel пишется напрямую через xlsxwriter в режиме ``constant_memory``:
+строки уходят в файл по мере записи, значения берутся из массивов numpy,
+поэтому память не растёт с размером таблицы. Раскладка листа повторяет
+``DataFrame.to_excel(index=True)`` с двухуровневым заголовком: строка групп
+(с объединением ячеек), строка диапазонов, пустая строка имён индекса и
+номера строк в первой колонке. Сам xlsxwriter импортируется только при
+записи книги.
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+
+from recording import BANDS, GROUPS
+
+# Форматы для выгрузки «для скриптов»
+TABLE_FORMATS = {"Parquet": "parquet", "CSV": "csv"}
+
+# Оформление заголовка как у pandas.DataFrame.to_excel
+HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+TIME_FORMAT = "hh:mm:ss"
+
+# По сколько строк участка записи форматировать за раз
+RANGE_CHUNK_ROWS = 50_000
+
+
+def _excel_serial(times):
+    """
+    Дата и время в числа Excel (система 1900) так же, как это делает
+    xlsxwriter для ``datetime``, но сразу для всего столбца.
+    """
+    times = pd.DatetimeIndex(times)
+    days = np.asarray((times - pd.Timestamp(1899, 12, 31)) / pd.Timedelta(days=1), dtype=np.float64)
+    # Время без даты разбирается как 01.01.1900, а в Excel это день 0 — как и xlsxwriter, вычитаем день
+    days = np.where(times.normalize() == pd.Timestamp(1900, 1, 1), days - 1, days)
+    # Excel считает 1900 год високосным: после 28.02.1900 сдвиг на день
+    return np.where(days > 59, days + 1, days)
+
+
+def _write_sheet(workbook, sheet_name, df, header, time_format):
+    worksheet = workbook.add_worksheet(sheet_name)
+    columns = list(df.columns)
+    n_rows = len(df)
+
+    # Строка 0: группы, одинаковые соседние группы объединяются
+    start = 0
+    while start < len(columns):
+        stop = start + 1
+        while stop < len(columns) and columns[stop][0] == columns[start][0] and columns[start][1]:
+            stop += 1
+        if stop - start > 1:
+            worksheet.merge_range(0, start + 1, 0, stop, columns[start][0], header)
+        else:
+            worksheet.write_string(0, start + 1, columns[start][0], header)
+        start = stop
+    worksheet.write_blank(0, 0, None, header)
+
+    # Строка 1: диапазоны; строка 2 — пустые имена индекса, как у pandas
+    worksheet.write_blank(1, 0, None, header)
+    for j, (_, band) in enumerate(columns, start=1):
+        if band:
+            worksheet.write_string(1, j, band, header)
+        else:
+            worksheet.write_blank(1, j, None, header)
+
+    # Колонки по типам: время — числами Excel с форматом, текст — строками, остальное — числами.
+    # Списки Python, а не массивы: поэлементный доступ к ним в цикле записи в разы быстрее
+    kinds = []
+    for col in columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            kinds.append(("time", _excel_serial(series).tolist()))
+        elif pd.api.types.is_numeric_dtype(series):
+            kinds.append(("number", series.to_numpy(dtype=np.float64).tolist()))
+        else:
+            kinds.append(("text", series.where(series.notna(), "").astype(str).tolist()))
+
+    write_number = worksheet.write_number
+    write_string = worksheet.write_string
+    for i in range(n_rows):
+        row = i + 3
+        write_number(row, 0, i, header)
+        for j, (kind, values) in enumerate(kinds, start=1):
+            value = values[i]
+            if kind == "text":
+                if value:
+                    write_string(row, j, value)
+            elif value == value:  # NaN пропускаем — пустая ячейка, как na_rep='' у pandas
+                if kind == "time":
+                    write_number(row, j, value, time_format)
+                else:
+                    write_number(row, j, value)
+
+
+def write_excel(path, sheets):
+    """
+    Записывает таблицы ``{имя листа: DataFrame}`` в один файл Excel,
+    не собирая книгу в памяти.
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(str(path), {"constant_memory": True})
+    try:
+        header = workbook.add_format(HEADER_FORMAT)
+        time_format = workbook.add_format({"num_format": TIME_FORMAT})
+        for sheet_name, df in sheets.items():
+            _write_sheet(workbook, sheet_name, df, header, time_format)
+    finally:
+        workbook.close()
+    return path
+
+
+def flat_columns(df):
+    """Плоские имена колонок для Parquet/CSV: «группа MEAN_диапазон», «Time», «Marker»"""
+    flat = df.copy(deep=False)
+    flat.columns = [f"{group} {band}" if band else group for group, band in df.columns]
+    return flat
+
+
+def write_table(df, path, fmt):
+    """Таблица в Parquet (время остаётся датой-временем) или CSV (время — ЧЧ:ММ:СС)"""
+    flat = flat_columns(df)
+    if fmt == "parquet":
+        flat.to_parquet(path, index=False)
+    else:
+        if "Time" in flat.columns:
+            flat["Time"] = flat["Time"].dt.strftime("%H:%M:%S")
+        flat.to_csv(path, index=False, encoding="utf-8-sig")
+    return path
+
+
+def write_range_text(out, recording, group, bands=BANDS):
+    """
+    Пишет запись (обычно участок — ``Recording.between``) для группы ``group``
+    в текстовый поток ``out``: строка заголовка
+    «# Time<TAB>Seconds<TAB>Marker<TAB>группа_диапазон...» и значения через табуляцию.
+
+    Таблица собирается кусками прямо из массивов записи, время берётся из
+    готовых строк ``recording.clock``.
+    """
+    band_columns = [(group, band) for band in bands if group in GROUPS]
+    positions = [GROUPS.index(g) * len(BANDS) + BANDS.index(b) for g, b in band_columns]
+    header = "\t".join(["Time", "Seconds", "Marker"] + [f"{g}_{b}" for g, b in band_columns])
+    out.write(f"# {header}\n")
+
+    clock, seconds, markers = recording.clock, recording.seconds, recording.markers
+    for chunk_start in range(0, len(recording), RANGE_CHUNK_ROWS):
+        chunk_stop = min(chunk_start + RANGE_CHUNK_ROWS, len(recording))
+        rows = slice(chunk_start, chunk_stop)
+        values = recording.values[rows, positions]
+        chunk = pd.DataFrame({"Time": clock[rows], "Seconds": seconds[rows], "Marker": markers[rows],
+                              **{j: values[:, j] for j in range(len(positions))}})
+        chunk.to_csv(out, sep="\t", header=False, index=False)
+    return out
+
+
+def range_text_bytes(recording, group, bands=BANDS):
+    """То же, что :func:`write_range_text`, целиком в памяти — для кнопки скачивания"""
+    buffer = io.StringIO()
+    write_range_text(buffer, recording, group, bands)
+    return buffer.getvalue().encode("utf-8")
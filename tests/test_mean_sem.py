@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from mean_sem import BlockAccumulator, block_mean_sem, carry_markers_forward, sweep_mean_sem
+from recording import BANDS as RECORDING_BANDS, GROUPS as RECORDING_GROUPS, Recording
+
+GROUPS = ["AVERAGE", "0[P3]15"]
+BANDS = ["УПП(<0.5Hz)", "Delta(0.5-4)", "Theta(4-7)"]
+
+
+def reference_mean_sem(df, groups, bands, window_size):
+    """Поблочный цикл, которым MEAN/SEM считались до векторизации (эталон)"""
+    n = len(df)
+    block_idx = np.arange(n) // window_size
+    block_groups = df.groupby(block_idx).groups
+
+    block_times = []
+    template = []
+    for g in groups:
+        mean_block = pd.DataFrame(np.nan, index=df.index, columns=df[g].columns)
+        sem_block = pd.DataFrame(np.nan, index=df.index, columns=df[g].columns)
+        for b in df[g].columns:
+            for blk, idxs in block_groups.items():
+                mean_block.at[idxs[-1], b] = df[g][b].loc[idxs].mean()
+                sem_block.at[idxs[-1], b] = df[g][b].loc[idxs].sem(ddof=1)
+                if g == groups[0] and b == df[g].columns[0]:
+                    block_times.append(df[("Seconds", "")].iloc[idxs[-1]])
+
+        mean_block.columns = pd.MultiIndex.from_tuples([(g, f"MEAN_{b}") for b in mean_block.columns])
+        sem_block.columns = pd.MultiIndex.from_tuples([(g, f"SEM_{b}") for b in sem_block.columns])
+        orig = df[g].copy()
+        orig.columns = pd.MultiIndex.from_tuples([(g, b) for b in orig.columns])
+        template.append(pd.concat([mean_block, sem_block, orig], axis=1))
+
+    df_final = pd.concat([df[[("Time", ""), ("Seconds", ""), ("Marker", "")]]] + template, axis=1)
+    mean_sem_cols = [col for col in df_final.columns if col[1].startswith(("MEAN_", "SEM_"))]
+    df_mean_sem = df_final[[("Time", ""), ("Seconds", ""), ("Marker", "")] + mean_sem_cols]
+    return df_final, df_mean_sem, block_times
+
+
+def reference_carry_markers(df_mean_sem):
+    """Построчный перенос маркеров, которым пользовалась страница до векторизации (эталон)"""
+    mean_sem_cols = [col for col in df_mean_sem.columns if col[1].startswith(("MEAN_", "SEM_"))]
+    marker_col = ("Marker", "")
+    df = df_mean_sem.copy()
+    pending = []
+    for i in range(len(df)):
+        row_has_data = df.loc[i, mean_sem_cols].notna().any()
+        current = df.at[i, marker_col]
+        if pending and row_has_data:
+            combined = " ".join(m.strip() for m in pending)
+            if pd.notna(current) and str(current).strip():
+                df.at[i, marker_col] = f"{combined} {str(current).strip()}"
+            else:
+                df.at[i, marker_col] = combined
+            pending = []
+        elif pd.notna(current) and str(current).strip() and not row_has_data:
+            pending.append(str(current).strip())
+            df.at[i, marker_col] = None
+    return df.loc[df[mean_sem_cols].notna().any(axis=1)].reset_index(drop=True)
+
+
+def make_frame(n_rows, markers=None, seed=0):
+    """Таблица в виде Recording.frame для групп GROUPS и диапазонов BANDS"""
+    rng = np.random.default_rng(seed)
+    columns = [(g, b) for g in GROUPS for b in BANDS]
+    values = rng.normal(10.0, 3.0, size=(n_rows, len(columns)))
+    if n_rows > 3:
+        values[3, 1] = np.nan  # пропуск не учитывается ни в MEAN, ни в SEM
+    head = pd.DataFrame({
+        ("Time", ""): pd.Timestamp("1900-01-01 10:00:00") + pd.to_timedelta(np.arange(n_rows), unit="s"),
+        ("Seconds", ""): np.arange(n_rows, dtype=np.float64),
+        ("Marker", ""): np.array(markers if markers is not None else [""] * n_rows, dtype=object),
+    })
+    head.columns = pd.MultiIndex.from_tuples(head.columns)
+    return pd.concat([head, pd.DataFrame(values, columns=pd.MultiIndex.from_tuples(columns))], axis=1)
+
+
+def assert_tables_match(actual, expected, tolerance=1e-12):
+    assert list(actual.columns) == list(expected.columns)
+    for col in actual.columns:
+        if col[0] in ("Time", "Marker"):
+            assert actual[col].tolist() == expected[col].tolist(), col
+        else:
+            np.testing.assert_allclose(actual[col].to_numpy(dtype=np.float64),
+                                       expected[col].to_numpy(dtype=np.float64),
+                                       rtol=tolerance, atol=tolerance, equal_nan=True, err_msg=str(col))
+
+
+@pytest.mark.parametrize("n_rows, window_size", [
+    (40, 10),  # только полные блоки
+    (43, 10),  # неполный последний блок из трёх строк
+    (41, 10),  # последний блок из одной строки: SEM — NaN
+    (7, 10),   # вся запись короче окна
+    (25, 1),   # окно из одной строки
+])
+def test_block_mean_sem_matches_reference_loop(n_rows, window_size):
+    df = make_frame(n_rows)
+    expected = reference_mean_sem(df, GROUPS, BANDS, window_size)
+    actual = block_mean_sem(df, GROUPS, BANDS, window_size)
+
+    assert_tables_match(actual[0], expected[0])
+    assert_tables_match(actual[1], expected[1])
+    assert actual[2] == expected[2]
+
+
+@pytest.mark.parametrize("offset", [0.0, 1e6])  # 1e6 — большое постоянное смещение значений
+@pytest.mark.parametrize("n_rows", [40, 43])
+def test_sweep_matches_block_mean_sem(n_rows, offset):
+    df = make_frame(n_rows)
+    value_cols = [(g, b) for g in GROUPS for b in BANDS]
+    df[value_cols] += offset
+    df.loc[17:19, ("AVERAGE", BANDS[2])] = np.nan  # несколько пропусков подряд
+    window_sizes = [1, 3, 7, 10, 50]  # неполные последние блоки; окно длиннее записи
+
+    sweep = sweep_mean_sem(df, GROUPS, BANDS, window_sizes)
+    for window_size in window_sizes:
+        expected = block_mean_sem(df, GROUPS, BANDS, window_size)
+        actual = sweep[window_size]
+        # Разности префиксных сумм совпадают с поблочным расчётом до ошибки округления, а не до бита
+        assert_tables_match(actual[0], expected[0], tolerance=1e-10)
+        assert_tables_match(actual[1], expected[1], tolerance=1e-10)
+        assert actual[2] == expected[2]
+
+
+def markers_at(n_rows, **rows):
+    markers = [""] * n_rows
+    for row, label in rows.items():
+        markers[int(row[1:])] = label
+    return markers
+
+
+@pytest.mark.parametrize("n_rows, markers, expected", [
+    # Подряд идущие маркеры внутри блока склеиваются в порядке записи
+    (30, markers_at(30, r3="В", r4="О", r5="Э"), ["В О Э", "", ""]),
+    # Маркер в строке блока остаётся последним после перенесённых
+    (30, markers_at(30, r8="В", r9="О"), ["В О", "", ""]),
+    # Маркер в неполном последнем блоке уходит на его последнюю строку
+    (24, markers_at(24, r21="К"), ["", "", "К"]),
+    # Маркер в первой строке
+    (30, markers_at(30, r0="Д"), ["Д", "", ""]),
+    # Маркеров нет
+    (30, markers_at(30), ["", "", ""]),
+])
+def test_carry_markers_forward(n_rows, markers, expected):
+    _, df_mean_sem, _ = block_mean_sem(make_frame(n_rows, markers), GROUPS, BANDS, 10)
+    actual = carry_markers_forward(df_mean_sem)
+    reference = reference_carry_markers(df_mean_sem)
+
+    assert actual[("Marker", "")].fillna("").tolist() == expected
+    assert actual[("Marker", "")].fillna("").tolist() == reference[("Marker", "")].fillna("").tolist()
+    assert_tables_match(actual.drop(columns=[("Marker", "")]), reference.drop(columns=[("Marker", "")]))
+
+
+def make_recording(n_rows, window_size, seed=1):
+    """Запись с маркерами, пропусками и полным блоком без значений (маркер из него переносится дальше)"""
+    rng = np.random.default_rng(seed)
+    values = rng.normal(10.0, 3.0, size=(n_rows, len(RECORDING_GROUPS) * len(RECORDING_BANDS)))
+    values[5, 3] = np.nan
+    values[window_size:2 * window_size] = np.nan
+    markers = np.full(n_rows, "", dtype=object)
+    for row, label in [(0, "Д"), (window_size + 2, "В"), (window_size + 3, "О"), (n_rows - 2, "К")]:
+        markers[row] = label
+    return Recording(np.datetime64("1900-01-01T10:00:00"), np.arange(n_rows, dtype=np.float64), markers,
+                     values.astype(np.float32))
+
+
+@pytest.mark.parametrize("window_size, steps", [
+    (10, [3, 10, 7, 1, 25, 11]),  # полные блоки, неполный последний, блок без значений
+    (1, [4, 5]),
+    (7, [64]),  # всё за одно обновление
+])
+def test_block_accumulator_matches_full_tables(window_size, steps):
+    recording = make_recording(sum(steps), window_size)
+    accumulator = BlockAccumulator(window_size)
+    n_rows = 0
+    for step in steps:
+        n_rows += step
+        grown = recording.view(0, n_rows)
+        df_clean, block_times = accumulator.update(grown, GROUPS, BANDS)
+        _, df_mean_sem, expected_times = block_mean_sem(grown.frame, GROUPS, BANDS, window_size)
+
+        assert_tables_match(df_clean, carry_markers_forward(df_mean_sem))
+        assert block_times == expected_times
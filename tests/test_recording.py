@@ -0,0 +1,102 @@
+import io
+import os
+import time
+
+import numpy as np
+import pytest
+
+from recording import (N_COLUMNS, SIDECAR_DIR, SIDECAR_STALE_HOURS, clock_to_datetime, normalize_markers,
+                       open_sidecar, read_recording, save_sidecar, spool_upload, unwrap_midnight)
+
+
+@pytest.mark.parametrize("raw, expected", [
+    (".", ""),          # точка-заполнитель — маркера нет
+    ("В.", "В"),        # буква с точкой
+    ("Э", "Э"),         # буква без точки
+    ("", ""),           # пустой столбец
+    ("   ", ""),        # только пробелы
+    (" О. ", "О"),      # пробелы вокруг маркера
+    (None, ""),         # пропуск
+    (np.nan, ""),
+])
+def test_normalize_markers(raw, expected):
+    assert normalize_markers([raw]).tolist() == [expected]
+
+
+@pytest.mark.parametrize("marker, tail, expected", [
+    (".", "", ""),
+    ("В.", "", "В"),
+    ("В.", " X", "В"),  # хвостовая пометка прибора после значений не сдвигает столбцы
+    (".", " X", ""),
+])
+def test_marker_is_second_token(marker, tail, expected):
+    values = " ".join(["-1"] * (N_COLUMNS - 2))
+    recording = read_recording(f"10:00:00 {marker} {values}{tail}\n")
+    assert recording.markers.tolist() == [expected]
+    assert recording.values[0, -1] == -1
+
+
+def seconds_from_start(clock, **kwargs):
+    time = unwrap_midnight(clock_to_datetime(clock), **kwargs)
+    return (time - time.iloc[0]).dt.total_seconds().tolist()
+
+
+def test_midnight_adds_a_day():
+    clock = ["23:59:58", "23:59:59", "00:00:00", "00:00:01"]
+    assert seconds_from_start(clock) == [0, 1, 2, 3]
+
+
+def test_small_backward_step_is_not_midnight():
+    clock = ["10:00:00", "10:00:01", "10:00:02", "10:00:01", "10:00:03"]
+    assert seconds_from_start(clock) == [0, 1, 2, 1, 3]
+
+
+def test_two_midnights():
+    clock = ["23:59:59", "00:00:00", "12:00:00", "23:59:59", "00:00:00"]
+    assert seconds_from_start(clock) == [0, 1, 43201, 86400, 86401]
+
+
+def test_midnight_between_chunks():
+    previous = clock_to_datetime(["23:59:59"]).iloc[0]
+    time = unwrap_midnight(clock_to_datetime(["00:00:00", "00:00:01"]), previous=previous)
+    assert (time.dt.day == 2).all()
+    np.testing.assert_array_equal(time.diff().dt.total_seconds().iloc[1:], [1])
+
+
+def synthetic_text(value, rows=5):
+    line = " ".join(["{clock}", "."] + [str(value)] * (N_COLUMNS - 2))
+    return "\n".join(line.format(clock=f"10:00:{i:02d}") for i in range(rows)) + "\n"
+
+
+def test_sidecar_keeps_mapped_copy_of_previous_content(tmp_path):
+    first = read_recording(synthetic_text(1), digest="first")
+    save_sidecar(first, tmp_path)
+    mapped = open_sidecar(tmp_path, "first")
+
+    second = read_recording(synthetic_text(2), digest="second")
+    save_sidecar(second, tmp_path)
+
+    assert (mapped.values == 1).all()
+    assert (open_sidecar(tmp_path, "second").values == 2).all()
+    assert (open_sidecar(tmp_path, "first").values == 1).all()
+
+
+def test_sidecar_removes_stale_copies(tmp_path):
+    save_sidecar(read_recording(synthetic_text(1), digest="first"), tmp_path)
+    meta = tmp_path / SIDECAR_DIR / "first" / "meta.json"
+    stale = time.time() - (SIDECAR_STALE_HOURS + 1) * 3600
+    os.utime(meta, (stale, stale))
+
+    save_sidecar(read_recording(synthetic_text(2), digest="second"), tmp_path)
+    assert open_sidecar(tmp_path, "first") is None
+
+
+def test_same_content_uploads_get_their_own_spool_files(tmp_path):
+    data = synthetic_text(1).encode()
+    first, first_digest = spool_upload(io.BytesIO(data), tmp_path)
+    second, second_digest = spool_upload(io.BytesIO(data), tmp_path)
+
+    assert first_digest == second_digest
+    assert first != second
+    first.unlink()
+    assert (read_recording(second, digest=second_digest).values == 1).all()
@@ -0,0 +1,22 @@
+import os
+import time
+
+import result_cache
+
+
+def test_version_is_part_of_the_key(monkeypatch):
+    path = result_cache.cache_path("abc", "mean_sem", (1,), ".npz")
+    monkeypatch.setattr(result_cache, "CACHE_VERSION", result_cache.CACHE_VERSION + 1)
+    assert result_cache.cache_path("abc", "mean_sem", (1,), ".npz") != path
+
+
+def test_evict_removes_old_and_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_DIR", tmp_path)
+    now = time.time()
+    for name, age_days in (("stale", 40), ("old", 3), ("recent", 2), ("fresh", 1)):
+        path = tmp_path / f"{name}.bin"
+        path.write_bytes(b"x" * 2 ** 19)
+        os.utime(path, (now - age_days * 86400,) * 2)
+
+    result_cache.evict(limit_mb=1, max_age_days=30)
+    assert sorted(f.stem for f in tmp_path.iterdir()) == ["fresh", "recent"]
@@ -0,0 +1,109 @@
+"""
+Замеры времени и памяти по этапам страниц.
+
+Включаются флажком «Замерять этапы» в боковой панели. Каждый этап страницы
+(разбор, расчёт, построение графика, передача в браузер, выгрузка)
+оборачивается в :func:`stage`: замеряется время и пик памяти Python
+(tracemalloc, в том числе массивы numpy) от начала этапа. Таблица замеров
+текущего перезапуска страницы показывается в боковой панели; если задана
+переменная окружения ``OEEG_TIMING_LOG``, каждый замер дописывается в этот
+файл строкой JSON.
+
+tracemalloc общий на процесс: при одновременной работе нескольких сессий
+пики памяти могут включать чужие выделения. Вложенные этапы сбивают пик
+внешнего, поэтому этапы не вкладываются друг в друга.
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import streamlit as st
+
+# Файл для построчного журнала замеров (JSON Lines); пусто — не писать
+LOG_PATH = os.environ.get("OEEG_TIMING_LOG", "")
+
+# Сколько этапов (во всех сессиях) сейчас замеряется: пока они идут, tracemalloc не выключается
+_active_stages = 0
+_tracing_lock = threading.Lock()
+
+
+def enabled():
+    return bool(st.session_state.get("timing_enabled"))
+
+
+def begin_run(page, placeholder=None):
+    """
+    Начало перезапуска страницы ``page``: пустая таблица замеров и место
+    ``placeholder`` в боковой панели, куда она выводится.
+    """
+    st.session_state["_timings"] = {"page": page, "records": [], "placeholder": placeholder}
+    if not enabled():
+        # Замеры выключили — снимаем накладные расходы tracemalloc, если этапы
+        # других сессий сейчас не замеряются (им понадобится снова — включат)
+        with _tracing_lock:
+            if _active_stages == 0 and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+
+def _show(run):
+    if run["placeholder"] is None:
+        return
+    import pandas as pd
+
+    table = pd.DataFrame(run["records"], columns=["stage", "seconds", "peak_mb", "rows"])
+    table.columns = ["Этап", "Время, с", "Пик памяти, МБ", "Строк"]
+    run["placeholder"].dataframe(table, hide_index=True, use_container_width=True)
+
+
+def _log(record):
+    try:
+        with open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    Замеряет этап ``name``, если замеры включены. ``rows`` — сколько строк
+    обработал этап; если оно известно только в конце, его можно записать в
+    возвращаемый словарь: ``with stage("parse") as t: ...; t["rows"] = n``.
+    """
+    record = {"stage": name, "seconds": None, "peak_mb": None, "rows": rows}
+    if not enabled():
+        yield record
+        return
+
+    global _active_stages
+    with _tracing_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _active_stages += 1
+    tracemalloc.reset_peak()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = time.perf_counter() - started
+        peak_mb = max(0, tracemalloc.get_traced_memory()[1] - memory_before) / 2 ** 20
+        with _tracing_lock:
+            _active_stages -= 1
+        record.update(seconds=round(seconds, 4), peak_mb=round(peak_mb, 2))
+        run = st.session_state.setdefault("_timings", {"page": "", "records": [], "placeholder": None})
+        run["records"].append(record)
+        _show(run)
+        if LOG_PATH:
+            recording = st.session_state.get("recording")
+            _log({
+                "time": datetime.datetime.now().isoformat(timespec="milliseconds"),
+                "page": run["page"],
+                "recording": getattr(recording, "name", ""),
+                **record,
+            })
@@ -0,0 +1,102 @@
+"""
+Прогрев сервера после запуска из лаунчера.
+
+Страницы импортируют тяжёлые библиотеки при первом открытии, а matplotlib
+при первом графике ещё и строит кэш шрифтов. Чтобы первое действие после
+запуска не ждало всего этого, лаунчер запускает в процессе Streamlit
+фоновый поток: как только сервер начинает слушать порт, поток по очереди
+импортирует модули страниц, отрисовывает маленькую фигуру (шрифты, Agg) и
+печатает время импорта каждого модуля.
+
+Выключается переменной окружения ``OEEG_WARMUP=0``.
+"""
+
+import os
+import socket
+import threading
+import time
+
+# Модули в порядке импорта; каждый следующий учитывает уже загруженные
+WARMUP_MODULES = (
+    "numpy",
+    "pandas",
+    "matplotlib",
+    "matplotlib.figure",
+    "channel_plot",
+    "mean_sem",
+    "result_cache",
+    "xlsxwriter",
+    "table_export",
+    "plotly.graph_objects",
+    "plotly.subplots",
+    "range_figure",
+)
+
+# Сколько ждать, пока сервер начнёт слушать порт, с
+BIND_TIMEOUT = 60
+
+# Время импорта модулей при прогреве: {модуль: секунды}
+import_times = {}
+
+
+def enabled():
+    return os.environ.get("OEEG_WARMUP", "1") != "0"
+
+
+def wait_for_bind(port, timeout=BIND_TIMEOUT):
+    """Ждёт, пока на ``port`` начнут принимать соединения; False — не дождались"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def prime_fonts():
+    """Кэш шрифтов matplotlib и бэкенд Agg: крошечная фигура с текстом в PNG"""
+    import io
+
+    import matplotlib
+    from matplotlib.figure import Figure
+
+    matplotlib.rcParams['font.family'] = 'DejaVu Sans'
+    fig = Figure(figsize=(1, 1))
+    fig.subplots().set_title("MEAN ± SEM")
+    fig.savefig(io.BytesIO(), format="png")
+
+
+def warm_up(port=None):
+    """Импортирует модули страниц (после того как сервер слушает ``port``) и печатает отчёт"""
+    if port is not None and not wait_for_bind(port):
+        return
+    started = time.perf_counter()
+    for name in WARMUP_MODULES:
+        module_started = time.perf_counter()
+        try:
+            __import__(name)
+        except ImportError as e:
+            print(f"[Прогрев] не удалось импортировать {name}: {e}", flush=True)
+            continue
+        import_times[name] = time.perf_counter() - module_started
+
+    fonts_started = time.perf_counter()
+    try:
+        prime_fonts()
+        import_times["шрифты matplotlib"] = time.perf_counter() - fonts_started
+    except Exception as e:
+        print(f"[Прогрев] шрифты matplotlib: {e}", flush=True)
+
+    report = ", ".join(f"{name} {seconds:.2f} с" for name, seconds in import_times.items())
+    print(f"[Прогрев] {report}; всего {time.perf_counter() - started:.2f} с", flush=True)
+
+
+def start_warmup(port=None):
+    """Запускает прогрев в фоновом потоке (если он не выключен)"""
+    if not enabled():
+        return None
+    thread = threading.Thread(target=warm_up, args=(port,), name="oeeg-warmup", daemon=True)
+    thread.start()
+    return thread